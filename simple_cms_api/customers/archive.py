@@ -0,0 +1,97 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from .history import record_change, record_changes
+from .models import ArchivedCustomer, Customer, CustomerChange
+
+# columns copied between the customers and the archived customers tables
+ARCHIVED_FIELDS = ('id', 'name', 'surname', 'created_by_id', 'updated_by_id', 'organization_id', 'deactivated_at', 'version')
+
+
+def archive_customers(batch_size, retention_days=None):
+    """
+    Moves the customers deactivated more than retention_days ago to the archived customers table, and their photos to
+    the archive folder of the storage, one batch per transaction. Returns the number of customers archived
+    """
+    if retention_days is None:
+        retention_days = settings.CUSTOMER_ARCHIVE_RETENTION_DAYS
+    deactivated_before = timezone.now() - timedelta(days=retention_days)
+
+    archived = 0
+    last_id = 0
+    while True:
+        customers = list(
+            Customer._base_manager.filter(is_active=False, deactivated_at__lt=deactivated_before, id__gt=last_id)
+            .order_by('id')[:batch_size]
+        )
+        if not customers:
+            return archived
+        last_id = customers[-1].id
+
+        # the photos are copied before the customers are locked, so the storage isn't called while holding the locks,
+        # and only deleted once the customers have been archived. A failure at any point, or a customer that changed
+        # in the meantime (and is left for a later run), leaves at most a copy of a photo behind
+        photos = {}
+        for customer in customers:
+            if customer.photo:
+                photos[customer.pk] = customer.photo.name
+                default_storage.copy(
+                    customer.photo.name, archive_photo_key(customer.photo.name), settings.CUSTOMER_ARCHIVE_PHOTO_STORAGE_CLASS
+                )
+
+        with transaction.atomic():
+            customers = [
+                customer
+                for customer in Customer._base_manager.select_for_update(skip_locked=True).filter(
+                    pk__in=[customer.pk for customer in customers], is_active=False, deactivated_at__lt=deactivated_before
+                )
+                if (customer.photo.name or None) == photos.get(customer.pk)
+            ]
+            if not customers:
+                continue
+
+            archived_customers = []
+            for customer in customers:
+                archived_customer = ArchivedCustomer(**{field: getattr(customer, field) for field in ARCHIVED_FIELDS})
+                if customer.photo:
+                    archived_customer.photo = archive_photo_key(customer.photo.name)
+                archived_customers.append(archived_customer)
+
+            ArchivedCustomer.objects.bulk_create(archived_customers)
+            record_changes(customers, CustomerChange.ACTION_ARCHIVED, {}, None)
+            Customer._base_manager.filter(pk__in=[customer.pk for customer in customers]).delete()
+
+        default_storage.delete_many([customer.photo.name for customer in customers if customer.photo])
+        archived += len(customers)
+
+
+def restore_customer(archived_customer, user):
+    """
+    Moves an archived customer (and its photo) back to the customers table as an active customer, and returns it
+    """
+    customer = Customer(**{field: getattr(archived_customer, field) for field in ARCHIVED_FIELDS})
+    customer.is_active = True
+    customer.deactivated_at = None
+    customer.version += 1
+    if archived_customer.photo:
+        customer.photo.name = archived_customer.photo[len(settings.CUSTOMER_ARCHIVE_PHOTO_PREFIX):]
+        default_storage.copy(archived_customer.photo, customer.photo.name, 'STANDARD')
+
+    with transaction.atomic():
+        # only the request that deletes the archived customer restores it
+        deleted, _ = ArchivedCustomer.objects.filter(pk=archived_customer.pk).delete()
+        if not deleted:
+            raise ArchivedCustomer.DoesNotExist()
+        customer.save(force_insert=True)
+        record_change(customer, CustomerChange.ACTION_RESTORED, {'is_active': [False, True]}, user)
+
+    if archived_customer.photo:
+        default_storage.delete(archived_customer.photo)
+
+    return customer
+
+
+def archive_photo_key(key):
+    return f'{settings.CUSTOMER_ARCHIVE_PHOTO_PREFIX}{key}'
@@ -0,0 +1,44 @@
+from collections import namedtuple
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .history import record_changes
+from .models import Customer, CustomerChange
+
+DeactivatedCustomer = namedtuple('DeactivatedCustomer', ['id', 'organization_id', 'version'])
+
+
+def deactivate_customers(queryset, user, chunk_size=None):
+    """
+    Deactivates the active customers of the queryset and returns how many were deactivated.
+
+    Every chunk of customers is deactivated with a single UPDATE ... RETURNING in its own transaction, so the rows are
+    only locked while their chunk is updated. The returned rows are used to record the changes in the history.
+    """
+    chunk_size = chunk_size or settings.CUSTOMER_DEACTIVATION_CHUNK_SIZE
+    deactivated = 0
+    while True:
+        with transaction.atomic():
+            customers = deactivate_chunk(queryset, user, chunk_size)
+            record_changes(customers, CustomerChange.ACTION_DELETED, {'is_active': [True, False]}, user)
+
+        deactivated += len(customers)
+        if len(customers) < chunk_size:
+            return deactivated
+
+
+def deactivate_chunk(queryset, user, chunk_size):
+    qn = connection.ops.quote_name
+    subquery, params = queryset.filter(is_active=True).order_by().values('id')[:chunk_size].query.sql_with_params()
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    # the customers are checked to be active again, as they could have been deactivated since the subquery read them
+    sql = (
+        f'UPDATE {qn(Customer._meta.db_table)} '
+        f'SET {qn("is_active")} = %s, {qn("deactivated_at")} = %s, {qn("updated_by_id")} = %s, {qn("version")} = {qn("version")} + 1 '
+        f'WHERE {qn("is_active")} = %s AND {qn("id")} IN ({subquery}) '
+        f'RETURNING {qn("id")}, {qn("organization_id")}, {qn("version")}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [False, now, user.pk, True, *params])
+        return [DeactivatedCustomer(*row) for row in cursor.fetchall()]
@@ -0,0 +1,26 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class Conflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The customer has been changed by another request. Fetch it again and retry.'
+    default_code = 'conflict'
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The customer has been changed since the version in the If-Match header.'
+    default_code = 'precondition_failed'
+
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being handled. Retry it later.'
+    default_code = 'idempotency_key_in_use'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'The Idempotency-Key has already been used for a different request.'
+    default_code = 'idempotency_key_reused'
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import QueryDict
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from .exceptions import IdempotencyKeyInUse, IdempotencyKeyReused
+from .models import IdempotencyKey
+
+# headers of the stored responses that are replayed along with them
+REPLAYED_HEADERS = ('ETag', 'Location')
+
+
+def request_hash(request):
+    """
+    Hash of what the request asks for: its method, path, If-Match header and data. Uploaded files are hashed by their
+    name, content type and content, so a retry matches even if its multipart body is encoded differently
+    """
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\0{request.META.get("HTTP_IF_MATCH", "")}\0'.encode())
+
+    data = request.data
+    if isinstance(data, QueryDict):
+        for field_name, values in sorted(data.lists(), key=lambda item: item[0]):
+            for value in values:
+                digest.update(f'\0{field_name}\0'.encode())
+                if isinstance(value, UploadedFile):
+                    digest.update(f'{value.name}\0{value.content_type}\0'.encode())
+                    for chunk in value.chunks():
+                        digest.update(chunk)
+                    value.seek(0)
+                else:
+                    digest.update(value.encode())
+    else:
+        digest.update(json.dumps(data, sort_keys=True, cls=JSONEncoder).encode())
+
+    return digest.hexdigest()
+
+
+def request_client(request):
+    # same client as the throttles (see simple_cms_api.throttling)
+    return f'{getattr(request.auth, "application_id", None)}_{request.user.pk}'
+
+
+class IdempotentMixin:
+    """
+    Lets clients retry a request safely by sending it with an Idempotency-Key header.
+
+    The first request with a key is handled as usual, and its response is stored for IDEMPOTENCY_KEY_TTL seconds. The
+    retries (the requests of the same client with the same key) get the stored response, without running the request
+    again. A retry that arrives while the first request is still being handled waits up to IDEMPOTENCY_WAIT_TIMEOUT
+    seconds for its response. Reusing a key for a different request is rejected with a 422.
+
+    Requests that fail with a server error or a conflict (e.g. the customer was changed concurrently) aren't stored, so
+    they can be retried with the same key.
+    """
+
+    def idempotent(self, handler, request, *args, **kwargs):
+        key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+        if key is None:
+            return handler(request, *args, **kwargs)
+        if not key or len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            raise ValidationError({'Idempotency-Key': 'Expected a key of 1 to 255 characters.'})
+
+        client = request_client(request)
+        hash_ = request_hash(request)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+        while True:
+            idempotency_key = self.claim_idempotency_key(client, key, hash_)
+            if idempotency_key is None:
+                break
+            if idempotency_key.request_hash != hash_:
+                raise IdempotencyKeyReused()
+            if idempotency_key.status_code is not None:
+                return self.replay(idempotency_key)
+            if time.monotonic() >= deadline:
+                raise IdempotencyKeyInUse()
+            time.sleep(settings.IDEMPOTENCY_POLL_INTERVAL)
+
+        try:
+            try:
+                response = handler(request, *args, **kwargs)
+            except Exception as exc:
+                # API errors (e.g. validation errors) are stored like any other response, the rest are raised again
+                response = self.handle_exception(exc)
+        except BaseException:
+            IdempotencyKey.objects.filter(client=client, key=key).delete()
+            raise
+
+        if response.status_code >= 500 or response.status_code == status.HTTP_409_CONFLICT:
+            IdempotencyKey.objects.filter(client=client, key=key).delete()
+        else:
+            IdempotencyKey.objects.filter(client=client, key=key).update(
+                status_code=response.status_code,
+                response=json.dumps(response.data, cls=JSONEncoder),
+                headers=json.dumps({header: response[header] for header in REPLAYED_HEADERS if response.has_header(header)}),
+            )
+        return response
+
+    def claim_idempotency_key(self, client, key, hash_):
+        """
+        Stores the key as being handled by this request and returns None, or returns the stored key if another request
+        has it. Expired keys, and keys of requests that have been handled for longer than IDEMPOTENCY_KEY_LOCK_TIMEOUT
+        (their process probably died), are claimed again
+        """
+        now = timezone.now()
+        IdempotencyKey.objects.filter(
+            Q(expires_at__lt=now) |
+            Q(status_code__isnull=True, created_at__lt=now - timedelta(seconds=settings.IDEMPOTENCY_KEY_LOCK_TIMEOUT)),
+            client=client,
+            key=key
+        ).delete()
+
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    client=client,
+                    key=key,
+                    request_hash=hash_,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+                )
+            return None
+        except IntegrityError:
+            idempotency_key = IdempotencyKey.objects.filter(client=client, key=key).first()
+            # if it was deleted in the meantime the caller tries again
+            return idempotency_key or IdempotencyKey(request_hash=hash_)
+
+    def replay(self, idempotency_key):
+        response = Response(
+            idempotency_key.decoded_response,
+            status=idempotency_key.status_code,
+            headers=idempotency_key.decoded_headers
+        )
+        response['Idempotent-Replayed'] = 'true'
+        return response
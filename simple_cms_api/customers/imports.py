@@ -0,0 +1,133 @@
+import codecs
+import csv
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from users.models import get_organization_id
+from .models import Customer, ImportJob, ImportJobError
+from .serializers import CustomerSerializer
+
+# columns of the file that are imported, photos can't be imported
+IMPORTED_FIELDS = ('name', 'surname')
+
+
+def claim_job():
+    """
+    Marks the oldest pending job (or a running job whose worker stopped making progress) as running, and returns it.
+    Locked rows are skipped, so several workers can claim jobs at the same time.
+    """
+    stale_before = timezone.now() - timedelta(seconds=settings.IMPORT_JOB_STALE_AFTER)
+    with transaction.atomic():
+        job = ImportJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status=ImportJob.STATUS_PENDING) | Q(status=ImportJob.STATUS_RUNNING, heartbeat_at__lt=stale_before)
+        ).order_by('created_at').first()
+
+        if job is not None:
+            now = timezone.now()
+            job.status = ImportJob.STATUS_RUNNING
+            job.started_at = job.started_at or now
+            job.heartbeat_at = now
+            job.save(update_fields=['status', 'started_at', 'heartbeat_at'])
+
+    return job
+
+
+def run_job(job, chunk_size):
+    """
+    Imports the rows of the job's file that haven't been imported yet, committing each chunk of rows together with the
+    job's progress, so a job interrupted at any point can be resumed from its last committed chunk.
+    """
+    try:
+        with job.source.open('rb') as source:
+            rows = read_rows(source, job.format)
+            for row_number in range(job.rows_processed):
+                next(rows, None)
+
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == chunk_size:
+                    import_chunk(job, chunk)
+                    chunk = []
+            import_chunk(job, chunk)
+    except (ValueError, csv.Error) as e:
+        # the file itself can't be read, any of its rows imported so far are kept
+        job.status = ImportJob.STATUS_FAILED
+        job.error = str(e)
+    else:
+        job.status = ImportJob.STATUS_COMPLETED
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+
+
+def import_chunk(job, rows):
+    """
+    Validates the rows with the CustomerSerializer rules and creates the valid ones with a single bulk insert
+    """
+    organization_id = get_organization_id(job.created_by)
+    customers = []
+    errors = []
+    for row_number, row in enumerate(rows, start=job.rows_processed + 1):
+        if row is None:
+            errors.append(ImportJobError(job=job, row=row_number, errors=json.dumps({'non_field_errors': ['Invalid row.']})))
+            continue
+
+        serializer = CustomerSerializer(data={field: row.get(field) for field in IMPORTED_FIELDS if field in row})
+        if serializer.is_valid():
+            customer = Customer(created_by_id=job.created_by_id, organization_id=organization_id, **serializer.validated_data)
+            customer.update_sort_key()
+            customers.append(customer)
+        else:
+            errors.append(ImportJobError(job=job, row=row_number, errors=json.dumps(serializer.errors)))
+
+    with transaction.atomic():
+        Customer.objects.bulk_create(customers, batch_size=settings.IMPORT_INSERT_BATCH_SIZE)
+        ImportJobError.objects.bulk_create(errors, batch_size=settings.IMPORT_INSERT_BATCH_SIZE)
+
+        job.rows_processed += len(rows)
+        job.rows_created += len(customers)
+        job.rows_failed += len(errors)
+        job.heartbeat_at = timezone.now()
+        job.save(update_fields=['rows_processed', 'rows_created', 'rows_failed', 'heartbeat_at'])
+
+
+def read_rows(source, file_format):
+    """
+    Yields the rows of the file as dicts (or None for the rows that aren't valid JSON), reading it in chunks
+    """
+    lines = iter_lines(source)
+    if file_format == ImportJob.FORMAT_CSV:
+        yield from csv.DictReader(lines)
+    else:
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+
+
+def iter_lines(source, chunk_size=64 * 1024):
+    """
+    Yields the lines of a binary file, with their line endings, decoding it as utf-8 (with or without a BOM)
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    while True:
+        chunk = source.read(chunk_size)
+        lines = (pending + decoder.decode(chunk, final=not chunk)).split('\n')
+        # the text after the last line ending may continue in the next chunk
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+
+        if not chunk:
+            if pending:
+                yield pending
+            return
@@ -0,0 +1,19 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from customers.archive import archive_customers
+
+
+class Command(BaseCommand):
+    help = 'Move the customers deleted more than CUSTOMER_ARCHIVE_RETENTION_DAYS ago (and their photos) to the archive, ' \
+           'in small batches. Meant to be run periodically (e.g. from cron).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=settings.CUSTOMER_ARCHIVE_RETENTION_DAYS,
+                            help='archive the customers deleted more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=500, help='customers archived per transaction')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        archived = archive_customers(options['batch_size'], options['retention_days'])
+        self.stdout.write(f'Archived {archived} customers in {time.monotonic() - started:.2f}s')
@@ -0,0 +1,63 @@
+import time
+from uuid import uuid4
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from customers.models import Customer, customer_sort_key
+from customers.serializers import CustomerSerializer, CustomerValuesSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark CustomerSerializer against CustomerValuesSerializer for customer listings. ' \
+           'The customers are created inside a transaction that is rolled back at the end.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['rows'], options['repeat'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def run(self, rows, repeat):
+        user = get_user_model().objects.create(username=f'bench_{uuid4().hex}')
+        created = 0
+        for num_rows in rows:
+            Customer.objects.bulk_create([
+                Customer(
+                    name=f'name {i}',
+                    surname=f'surname {i}',
+                    photo=f'{settings.MEDIA_URL}/{uuid4().hex}.jpg' if i % 2 else None,
+                    created_by=user,
+                    updated_by=user if i % 3 else None,
+                    sort_key=customer_sort_key(f'name {i}', f'surname {i}'),
+                )
+                for i in range(created, num_rows)
+            ], batch_size=500)
+            created = max(created, num_rows)
+            queryset = Customer.objects.order_by('id')[:num_rows]
+
+            results = []
+            for name, serialize in [
+                ('CustomerSerializer', lambda: CustomerSerializer(queryset, many=True).data),
+                ('CustomerValuesSerializer', lambda: CustomerValuesSerializer(CustomerValuesSerializer.values(queryset)).data),
+            ]:
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    data = serialize()
+                    timings.append(time.perf_counter() - start)
+                results.append((name, min(timings), data))
+
+            identical = 'identical' if results[0][2] == results[1][2] else 'DIFFERENT'
+            report = ' '.join(f'{name}={num_rows / best:,.0f} rows/s' for name, best, _ in results)
+            self.stdout.write(f'{num_rows} customers: {report} (output {identical})')
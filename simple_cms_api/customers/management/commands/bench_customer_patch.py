@@ -0,0 +1,80 @@
+import statistics
+import time
+from datetime import timedelta
+from uuid import uuid4
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model, get_application_model
+from rest_framework.test import APIRequestFactory, force_authenticate
+from customers.models import Customer
+from customers.views import CustomerDetail
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the latency (p50/p99) of PATCH /customers/<pk> with and without recording the change history. ' \
+           'Everything is done inside a transaction that is rolled back at the end.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='PATCH requests per run')
+        parser.add_argument('--repeat', type=int, default=3, help='times the requests are repeated')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['requests'], options['repeat'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def run(self, num_requests, repeat):
+        user = get_user_model().objects.create(username=f'bench_{uuid4().hex}')
+        application = get_application_model().objects.create(
+            name='bench',
+            user=user,
+            client_type='confidential',
+            authorization_grant_type='authorization-code'
+        )
+        token = get_access_token_model().objects.create(
+            user=user,
+            token=uuid4().hex,
+            application=application,
+            expires=timezone.now() + timedelta(days=1),
+            scope='read write'
+        )
+        customer = Customer.objects.create(name='name', surname='surname', created_by=user)
+
+        # throttling is left out, it would reject most of the requests
+        view = CustomerDetail.as_view(throttle_classes=[])
+        factory = APIRequestFactory()
+
+        def patch(i):
+            request = factory.patch(f'/customers/{customer.pk}', {'name': f'name {i}'}, format='json')
+            force_authenticate(request, user=user, token=token)
+            start = time.perf_counter()
+            response = view(request, pk=customer.pk)
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200, response.data
+            return elapsed
+
+        # warm up
+        for i in range(min(num_requests, 200)):
+            patch(i)
+
+        # the requests with and without history alternate, so both get the same share of the noise of the machine
+        timings = {False: [], True: []}
+        for i in range(repeat * num_requests):
+            for history_enabled in (False, True):
+                with override_settings(CUSTOMER_HISTORY_ENABLED=history_enabled):
+                    timings[history_enabled].append(patch(i))
+
+        for history_enabled, name in [(False, 'without history'), (True, 'with history')]:
+            quantiles = statistics.quantiles(timings[history_enabled], n=100)
+            self.stdout.write(f'PATCH {name}: p50={quantiles[49] * 1000:.2f}ms p99={quantiles[98] * 1000:.2f}ms '
+                              f'({len(timings[history_enabled])} requests)')
@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from customers.imports import claim_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Worker that runs the pending customer import jobs. Several workers can run at the same time, and the jobs ' \
+           'of a worker that crashed are resumed by another one.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='rows validated and committed at once')
+        parser.add_argument('--poll-interval', type=float, default=5, help='seconds to wait when there are no jobs')
+        parser.add_argument('--once', action='store_true', help='exit when there are no more jobs to run')
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f'Running import job {job.id} from row {job.rows_processed + 1}')
+            started = time.monotonic()
+            run_job(job, options['chunk_size'])
+            self.stdout.write(f'Import job {job.id} {job.status}: {job.rows_created} customers created, '
+                              f'{job.rows_failed} rows failed in {time.monotonic() - started:.2f}s')
@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from customers.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete the expired idempotency keys in small batches. Meant to be run periodically (e.g. from cron).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0, help='seconds to wait between batches')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        expired = IdempotencyKey.objects.filter(expires_at__lt=timezone.now())
+
+        deleted = 0
+        while True:
+            pks = list(expired.order_by().values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+
+            with transaction.atomic():
+                IdempotencyKey.objects.filter(pk__in=pks).delete()
+            deleted += len(pks)
+
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(f'Deleted {deleted} idempotency keys in {time.monotonic() - started:.2f}s')
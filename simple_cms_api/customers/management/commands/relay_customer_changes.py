@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from customers.history import relay_changes
+
+
+class Command(BaseCommand):
+    help = 'Move the customer changes from the outbox to the customer history in batches. Meant to be run ' \
+           'continuously (or frequently, with --once) so the history is only a few seconds behind.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='changes moved per transaction')
+        parser.add_argument('--poll-interval', type=float, default=1, help='seconds to wait when there are no changes')
+        parser.add_argument('--once', action='store_true', help='exit when the outbox is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            relayed = relay_changes(options['batch_size'])
+            if relayed:
+                self.stdout.write(f'Relayed {relayed} customer changes in {time.monotonic() - started:.2f}s')
+
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0002_customer_is_active'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.0.7 on 2026-10-19 19:15
+
+import unicodedata
+from django.db import migrations, models, transaction
+
+SORT_KEY_MAX_LENGTH = 100
+
+
+def customer_sort_key(name, surname):
+    """
+    Frozen copy of customers.models.customer_sort_key, so this migration doesn't change if that one does
+    """
+    decomposed = unicodedata.normalize('NFKD', f'{surname}\t{name}')
+    key = ''.join(character for character in decomposed if not unicodedata.combining(character)).casefold()
+
+    return key[:SORT_KEY_MAX_LENGTH]
+
+
+def populate_sort_keys(apps, schema_editor):
+    Customer = apps.get_model('customers', 'Customer')
+    last_id = 0
+    while True:
+        # a short transaction per batch, so the customers aren't locked until the whole table is done
+        with transaction.atomic():
+            customers = list(Customer._base_manager.filter(id__gt=last_id).order_by('id')[:1000])
+            if not customers:
+                return
+
+            for customer in customers:
+                customer.sort_key = customer_sort_key(customer.name, customer.surname)
+            Customer._base_manager.bulk_update(customers, ['sort_key'])
+        last_id = customers[-1].id
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('customers', '0004_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='sort_key',
+            field=models.CharField(default='', editable=False, max_length=SORT_KEY_MAX_LENGTH),
+        ),
+        migrations.RunPython(populate_sort_keys, migrations.RunPython.noop),
+    ]
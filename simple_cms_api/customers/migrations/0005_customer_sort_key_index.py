@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+INDEX = models.Index(condition=models.Q(is_active=True), fields=['sort_key', 'id'], name='customers_sort_key_idx')
+
+
+def add_index(apps, schema_editor):
+    Customer = apps.get_model('customers', 'Customer')
+    if schema_editor.connection.vendor == 'postgresql':
+        # build the index without locking the customers table against writes
+        schema_editor.add_index(Customer, INDEX, concurrently=True)
+    else:
+        schema_editor.add_index(Customer, INDEX)
+
+
+def remove_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model('customers', 'Customer'), INDEX)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('customers', '0005_customer_sort_key'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(add_index, remove_index)],
+            state_operations=[migrations.AddIndex(model_name='customer', index=INDEX)],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.0.7 on 2026-10-19 19:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_organization_profile'),
+        ('customers', '0005_customer_sort_key_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='organization',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='customers', to='users.Organization'),
+        ),
+    ]
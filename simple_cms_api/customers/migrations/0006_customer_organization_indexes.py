@@ -0,0 +1,46 @@
+from django.db import migrations, models
+
+# indexes of the customers scoped to an organization
+INDEXES = [
+    models.Index(fields=['organization', 'id'], name='customers_organization_idx'),
+    models.Index(condition=models.Q(is_active=True), fields=['organization', 'sort_key', 'id'], name='customers_org_sort_key_idx'),
+]
+# replaced by customers_org_sort_key_idx, and only dropped once that one has been built
+OLD_INDEX = models.Index(condition=models.Q(is_active=True), fields=['sort_key', 'id'], name='customers_sort_key_idx')
+
+
+def add_indexes(apps, schema_editor):
+    Customer = apps.get_model('customers', 'Customer')
+    # build the indexes without locking the customers table against writes
+    concurrently = {'concurrently': True} if schema_editor.connection.vendor == 'postgresql' else {}
+    for index in INDEXES:
+        schema_editor.add_index(Customer, index, **concurrently)
+    schema_editor.remove_index(Customer, OLD_INDEX, **concurrently)
+
+
+def remove_indexes(apps, schema_editor):
+    Customer = apps.get_model('customers', 'Customer')
+    concurrently = {'concurrently': True} if schema_editor.connection.vendor == 'postgresql' else {}
+    schema_editor.add_index(Customer, OLD_INDEX, **concurrently)
+    for index in INDEXES:
+        schema_editor.remove_index(Customer, index, **concurrently)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('customers', '0006_customer_organization'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(add_indexes, remove_indexes)],
+            state_operations=[
+                migrations.AddIndex(model_name='customer', index=INDEXES[0]),
+                migrations.AddIndex(model_name='customer', index=INDEXES[1]),
+                migrations.RemoveIndex(model_name='customer', name=OLD_INDEX.name),
+            ],
+        ),
+    ]
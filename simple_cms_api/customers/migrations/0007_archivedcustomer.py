@@ -0,0 +1,65 @@
+# Generated by Django 3.0.7 on 2026-10-19 19:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def set_deactivated_at(apps, schema_editor):
+    # the customers deleted before this migration start their retention period now
+    Customer = apps.get_model('customers', 'Customer')
+    Customer._base_manager.filter(is_active=False).update(deactivated_at=django.utils.timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_organization_profile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('customers', '0006_customer_organization_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCustomer',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=30)),
+                ('surname', models.CharField(max_length=50)),
+                ('photo', models.CharField(blank=True, max_length=255, null=True)),
+                ('deactivated_at', models.DateTimeField(null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('version', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='deactivated_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(condition=models.Q(is_active=False), fields=['deactivated_at'], name='customers_deactivated_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedcustomer',
+            name='created_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_customers_created', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedcustomer',
+            name='organization',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='archived_customers', to='users.Organization'),
+        ),
+        migrations.AddField(
+            model_name='archivedcustomer',
+            name='updated_by',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='archived_customers_updated', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcustomer',
+            index=models.Index(fields=['organization', 'id'], name='customers_archived_org_idx'),
+        ),
+        migrations.RunPython(set_deactivated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.0.7 on 2026-10-19 19:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('customers', '0007_archivedcustomer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_id', models.IntegerField()),
+                ('organization_id', models.IntegerField(null=True)),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted'), ('archived', 'Archived'), ('restored', 'Restored')], max_length=10)),
+                ('changes', models.TextField()),
+                ('changed_by_id', models.IntegerField(null=True)),
+                ('changed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CustomerHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_id', models.IntegerField()),
+                ('organization_id', models.IntegerField(null=True)),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted'), ('archived', 'Archived'), ('restored', 'Restored')], max_length=10)),
+                ('changes', models.TextField()),
+                ('changed_at', models.DateTimeField()),
+                ('changed_by', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='customer_changes', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='customerhistory',
+            index=models.Index(fields=['customer_id', 'id'], name='customers_history_idx'),
+        ),
+    ]
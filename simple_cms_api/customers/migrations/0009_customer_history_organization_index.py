@@ -0,0 +1,17 @@
+# Generated by Django 3.0.7 on 2026-10-19 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0008_customer_history'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customerhistory',
+            index=models.Index(fields=['organization_id', 'id'], name='customers_history_org_idx'),
+        ),
+    ]
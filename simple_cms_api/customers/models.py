@@ -1,8 +1,22 @@
 from django.db import models
+from django.db.models import F, Q
 from django.conf import settings
+from users.models import get_organization_id
 from uuid import uuid4
+import json
+import unicodedata
 
-class CustomerManager(models.Manager):
+class CustomerQuerySet(models.QuerySet):
+    def for_organization(self, organization_id):
+        """
+        Customers owned by the organization (tenant), or by no organization if organization_id is None
+        """
+        if organization_id is None:
+            return self.filter(organization__isnull=True)
+        return self.filter(organization_id=organization_id)
+
+
+class CustomerManager(models.Manager.from_queryset(CustomerQuerySet)):
     def get_queryset(self):
         return super().get_queryset().filter(is_active=True)
 
@@ -13,12 +27,251 @@ def rename_file(instance, filename):
     return f'{settings.MEDIA_URL}/{uuid4().hex}.{file_extension}'
 
 
+def customer_sort_key(name, surname):
+    """
+    Case and accent insensitive key to sort customers by surname and then name
+    """
+    decomposed = unicodedata.normalize('NFKD', f'{surname}\t{name}')
+    key = ''.join(character for character in decomposed if not unicodedata.combining(character)).casefold()
+
+    return key[:Customer.SORT_KEY_MAX_LENGTH]
+
+
 class Customer(models.Model):
+    SORT_KEY_MAX_LENGTH = 100
+
     name = models.CharField(max_length=30, blank=False)
     surname = models.CharField(max_length=50, blank=False)
     photo = models.FileField(upload_to=rename_file, blank=True, null=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="customers_created", null=False, on_delete=models.PROTECT)
     updated_by = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="customers_updated", null=True, on_delete=models.PROTECT)
+    # tenant that owns the customer, indexed by the composite indexes below
+    organization = models.ForeignKey('users.Organization', related_name="customers", null=True, db_index=False, on_delete=models.PROTECT)
     is_active = models.BooleanField(default=True)
+    deactivated_at = models.DateTimeField(null=True)
+    version = models.PositiveIntegerField(default=0)
+    # precomputed by update_sort_key() whenever the name or the surname changes, used to list customers alphabetically
+    sort_key = models.CharField(max_length=SORT_KEY_MAX_LENGTH, editable=False, default='')
 
     objects = CustomerManager()
+    all_objects = CustomerQuerySet.as_manager()  # includes the deactivated customers
+
+    class Meta:
+        # every query is scoped to an organization, so the indexes lead with it
+        indexes = [
+            models.Index(fields=['organization', 'id'], name='customers_organization_idx'),
+            models.Index(fields=['organization', 'sort_key', 'id'], name='customers_org_sort_key_idx', condition=Q(is_active=True)),
+            # used to find the customers to archive
+            models.Index(fields=['deactivated_at'], name='customers_deactivated_idx', condition=Q(is_active=False)),
+        ]
+
+    class VersionConflict(Exception):
+        pass
+
+    def update_sort_key(self):
+        """
+        Must be called before saving customers without save() (e.g. with bulk_create)
+        """
+        self.sort_key = customer_sort_key(self.name, self.surname)
+
+    def save(self, *args, **kwargs):
+        self.update_sort_key()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and ({'name', 'surname'} & set(update_fields)):
+            kwargs['update_fields'] = {*update_fields, 'sort_key'}
+
+        super().save(*args, **kwargs)
+
+    def save_versioned(self, update_fields):
+        """
+        Saves only the update_fields of the customer with a single UPDATE ... WHERE id = ? AND version = ?, so the
+        update is only applied if nobody has changed the customer since it was read. Raises VersionConflict otherwise.
+        """
+        if {'name', 'surname'} & set(update_fields):
+            self.update_sort_key()
+            update_fields = [*update_fields, 'sort_key']
+
+        values = {}
+        for field_name in update_fields:
+            field = self._meta.get_field(field_name)
+            values[field.attname] = field.pre_save(self, False)
+
+        updated = Customer._base_manager.filter(pk=self.pk, version=self.version).update(
+            version=F('version') + 1,
+            **values
+        )
+        if not updated:
+            raise Customer.VersionConflict()
+
+        self.version += 1
+
+
+class ArchivedCustomer(models.Model):
+    """
+    Customer that was deactivated longer than CUSTOMER_ARCHIVE_RETENTION_DAYS ago, moved out of the customers table
+    by the archive_customers command. It keeps the id it had as a customer, so it can be restored with it
+    """
+    id = models.IntegerField(primary_key=True)
+    name = models.CharField(max_length=30)
+    surname = models.CharField(max_length=50)
+    # key of the photo, under the CUSTOMER_ARCHIVE_PHOTO_PREFIX folder
+    photo = models.CharField(max_length=255, blank=True, null=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="archived_customers_created", null=False, on_delete=models.PROTECT)
+    updated_by = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="archived_customers_updated", null=True, on_delete=models.PROTECT)
+    organization = models.ForeignKey('users.Organization', related_name="archived_customers", null=True, db_index=False, on_delete=models.PROTECT)
+    deactivated_at = models.DateTimeField(null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    version = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['organization', 'id'], name='customers_archived_org_idx'),
+        ]
+
+
+class CustomerChange(models.Model):
+    """
+    Outbox of customer changes. Every change is appended here in the same transaction as the change itself, and
+    moved to CustomerHistory by the relay_customer_changes command. The table is append-only and has no indexes (nor
+    foreign keys) besides its primary key, so the insert adds as little as possible to the latency of the request.
+    """
+    ACTION_CREATED = 'created'
+    ACTION_UPDATED = 'updated'
+    ACTION_DELETED = 'deleted'
+    ACTION_ARCHIVED = 'archived'
+    ACTION_RESTORED = 'restored'
+    ACTION_CHOICES = [
+        (ACTION_CREATED, 'Created'),
+        (ACTION_UPDATED, 'Updated'),
+        (ACTION_DELETED, 'Deleted'),
+        (ACTION_ARCHIVED, 'Archived'),
+        (ACTION_RESTORED, 'Restored'),
+    ]
+
+    customer_id = models.IntegerField()
+    organization_id = models.IntegerField(null=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    changes = models.TextField()  # changed fields as JSON, {field: [old value, new value]}
+    changed_by_id = models.IntegerField(null=True)
+    changed_at = models.DateTimeField()
+
+
+class CustomerHistory(models.Model):
+    """
+    Changes of the customers, in the order they were relayed from the CustomerChange outbox. The ids are assigned by
+    the relay, which runs one batch at a time, so they only grow: a reader can follow the history with the last id it saw
+    """
+    customer_id = models.IntegerField()
+    organization_id = models.IntegerField(null=True)
+    action = models.CharField(max_length=10, choices=CustomerChange.ACTION_CHOICES)
+    changes = models.TextField()
+    changed_by = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="customer_changes", null=True, db_constraint=False, db_index=False, on_delete=models.DO_NOTHING)
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer_id', 'id'], name='customers_history_idx'),
+            # used to deliver the changes of an organization to its webhooks
+            models.Index(fields=['organization_id', 'id'], name='customers_history_org_idx'),
+        ]
+
+    @property
+    def decoded_changes(self):
+        return json.loads(self.changes)
+
+
+def import_key_prefix(user):
+    """
+    Bucket's folder of the files imported by the user's organization (or by the user, if they don't belong to any).
+    Only the files in it can be imported by them
+    """
+    organization_id = get_organization_id(user)
+    owner = f'organization-{organization_id}' if organization_id is not None else f'user-{user.pk}'
+
+    return f'{settings.IMPORTS_URL}{owner}/'
+
+
+def rename_import_file(instance, filename):
+    file_extension = filename.split('.')[-1]
+
+    return f'{import_key_prefix(instance.created_by)}{uuid4().hex}.{file_extension}'
+
+
+class ImportJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    FORMAT_CSV = 'csv'
+    FORMAT_NDJSON = 'ndjson'
+    FORMAT_CHOICES = [
+        (FORMAT_CSV, 'CSV'),
+        (FORMAT_NDJSON, 'NDJSON'),
+    ]
+
+    source = models.FileField(upload_to=rename_import_file, max_length=255)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="customer_imports", null=False, on_delete=models.PROTECT)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    # last time the worker committed progress, jobs of workers that stop making progress are resumed by another one
+    heartbeat_at = models.DateTimeField(null=True)
+    # rows of the file already handled (created or failed), the job is resumed after them
+    rows_processed = models.PositiveIntegerField(default=0)
+    rows_created = models.PositiveIntegerField(default=0)
+    rows_failed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='customers_importjob_queue_idx'),
+        ]
+
+
+class ImportJobError(models.Model):
+    job = models.ForeignKey(ImportJob, related_name="errors", on_delete=models.CASCADE)
+    row = models.PositiveIntegerField()
+    errors = models.TextField()  # validation errors of the row, as JSON
+
+    @property
+    def decoded_errors(self):
+        return json.loads(self.errors)
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response to the first request a client sent with an Idempotency-Key header, replayed to the retries of that
+    request until it expires. While the first request is being handled the response is empty (status_code is null)
+    """
+    client = models.CharField(max_length=64)  # application and user that sent the request
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)  # sha256 of the request, see customers.idempotency
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.TextField(blank=True)  # data of the response, as JSON
+    headers = models.TextField(blank=True)  # headers of the response replayed with it, as JSON
+    created_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'key'], name='customers_idempotency_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='customers_idempotency_exp_idx'),
+        ]
+
+    @property
+    def decoded_response(self):
+        return json.loads(self.response)
+
+    @property
+    def decoded_headers(self):
+        return json.loads(self.headers)
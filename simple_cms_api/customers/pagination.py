@@ -0,0 +1,98 @@
+import binascii
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class ImportJobPagination(LimitOffsetPagination):
+    default_limit = 100
+    max_limit = 1000
+
+
+class ArchivedCustomerPagination(LimitOffsetPagination):
+    default_limit = 100
+    max_limit = 1000
+
+
+class CustomerHistoryPagination(CursorPagination):
+    """
+    Pages the history of a customer newest first, with cursors on the (customer_id, id) index
+    """
+    ordering = '-id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class CustomerKeysetPagination(BasePagination):
+    """
+    Pages customers alphabetically (by surname and then name) with keyset cursors, so every page costs the same
+    index range scan no matter how deep it is. It's only used when the `ordering=name` query parameter is sent.
+
+    The cursor is the (sort_key, id) of the last customer of the previous page.
+    """
+    ordering_param = 'ordering'
+    ordering_value = 'name'
+    cursor_param = 'cursor'
+    page_size_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.ordering_param) != self.ordering_value:
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by('sort_key', 'id')
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            sort_key, last_id = cursor
+            # (sort_key, id) > (cursor's sort_key, cursor's id), written so the index range scan starts at sort_key
+            queryset = queryset.filter(Q(sort_key__gte=sort_key) & (Q(sort_key__gt=sort_key) | Q(id__gt=last_id)))
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_position = (page[-1].sort_key, page[-1].id) if self.has_next else None
+
+        return page
+
+    def get_page_size(self, request):
+        try:
+            return min(max(int(request.query_params[self.page_size_param]), 1), self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_param)
+        if encoded is None:
+            return None
+
+        try:
+            sort_key, last_id = json.loads(b64decode(encoded.encode('ascii'), altchars=b'-_').decode('utf-8'))
+            return str(sort_key), int(last_id)
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound('Invalid cursor')
+
+    def encode_cursor(self, position):
+        return b64encode(json.dumps(position).encode('utf-8'), altchars=b'-_').decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
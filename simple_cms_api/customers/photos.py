@@ -0,0 +1,139 @@
+import hashlib
+import os
+import re
+import tempfile
+
+range_header = re.compile(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Returns the (start, end) bytes, both included, of a `Range: bytes=...` header for a file of the given size, or None
+    if the whole file has to be sent (no header, one that can't be parsed or one with several ranges, which are not
+    supported). Raises RangeNotSatisfiable if the range is out of the file
+    """
+    match = range_header.match(header or '')
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if not first:
+        # the last `last` bytes
+        if not last:
+            return None
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+class PhotoCache:
+    """
+    Bounded cache of photos on the local disk, so the photos that are viewed again are read from it instead of from the
+    storage. Every photo is a file named after the hash of its key, and once the files take more than max_size bytes
+    the least recently viewed ones are deleted.
+
+    Photo keys are unique per upload, so a cached photo never gets stale. The directory can be shared by the processes
+    of a host.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key):
+        """
+        Path of the cached photo, or None if it isn't cached
+        """
+        path = self.path(key)
+        try:
+            # the modification time is the last time the photo was viewed
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def open(self, key):
+        """
+        Opens the cached photo, or returns None if it isn't cached
+        """
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            # evicted by another process in the meantime
+            return None
+
+    def tee(self, key, chunks):
+        """
+        Yields the chunks of the photo while writing them to the cache, so the photo is sent as it's read from the
+        storage. Other processes only see it once all the chunks have been written, and if they aren't (e.g. the client
+        disconnected and the generator was closed) nothing is cached
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in chunks:
+                    file.write(chunk)
+                    yield chunk
+            path = self.path(key)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        self.evict(keep=path)
+
+    def put(self, key, chunks):
+        """
+        Writes the photo to the cache chunk by chunk and returns its path
+        """
+        for _ in self.tee(key, chunks):
+            pass
+        return self.path(key)
+
+    def evict(self, keep=None):
+        """
+        Deletes the least recently viewed photos (except `keep`) until the cache fits in max_size
+        """
+        entries = []
+        total_size = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp') or entry.path == keep:
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+        if keep is not None:
+            total_size += os.path.getsize(keep)
+
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                return
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
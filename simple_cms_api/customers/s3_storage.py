@@ -0,0 +1,49 @@
+from django.utils.deconstruct import deconstructible
+from storages.backends.s3boto3 import S3Boto3Storage
+from .storage import PhotoStorageMixin
+
+
+@deconstructible
+class S3PhotoStorage(PhotoStorageMixin, S3Boto3Storage):
+    """
+    Customer photos in the S3 bucket. It's kept apart from the other storages, as importing it imports boto3
+    """
+
+    def key(self, name):
+        return self._encode_name(self._normalize_name(self._clean_name(name)))
+
+    def copy(self, name, new_name, storage_class=None):
+        # the file is copied inside the bucket, without downloading it
+        extra_args = {'StorageClass': storage_class} if storage_class else {}
+        self.bucket.meta.client.copy_object(
+            Bucket=self.bucket.name,
+            Key=self.key(new_name),
+            CopySource={'Bucket': self.bucket.name, 'Key': self.key(name)},
+            **extra_args
+        )
+
+    def delete_many(self, names):
+        keys = [self.key(name) for name in names]
+        # delete_objects accepts up to 1000 keys per request
+        for start in range(0, len(keys), 1000):
+            self.bucket.meta.client.delete_objects(
+                Bucket=self.bucket.name,
+                Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True}
+            )
+
+    def iter_chunks(self, name, start=0, end=None, chunk_size=64 * 1024):
+        # only the requested bytes are downloaded, and they are streamed instead of being spooled to a temporary file
+        # like open() does
+        response = self.bucket.meta.client.get_object(
+            Bucket=self.bucket.name,
+            Key=self.key(name),
+            Range=f'bytes={start}-{"" if end is None else end}'
+        )
+        yield from response['Body'].iter_chunks(chunk_size)
+
+    def presigned_url(self, name, expire=None):
+        return self.bucket.meta.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket.name, 'Key': self.key(name)},
+            ExpiresIn=self.querystring_expire if expire is None else expire
+        )
@@ -1,7 +1,18 @@
+import posixpath
+from collections import OrderedDict
 from rest_framework import serializers
-from .models import Customer
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
+from rest_framework.utils.serializer_helpers import ReturnList
+from users.models import get_organization_id
+from .exceptions import Conflict
+from .history import created_changes, diff, record_change, snapshot
+from .models import ArchivedCustomer, Customer, CustomerChange, CustomerHistory, ImportJob, ImportJobError, import_key_prefix
 from django.conf import settings
-import boto3
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
 
 class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
@@ -13,41 +24,62 @@ class CustomerSerializer(serializers.ModelSerializer):
             'photo',
             'created_by',
             'updated_by',
+            'version',
         )
         extra_kwargs = {
             'created_by': {'read_only': True},
             'updated_by': {'read_only': True},
+            'version': {'read_only': True},
         }
 
     def create(self, validated_data):
         user_creating = self.context['request'].user
         customer = Customer(**validated_data)
         customer.created_by = user_creating
-        customer.save()
+        customer.organization_id = get_organization_id(user_creating)
+        with transaction.atomic():
+            customer.save()
+            record_change(customer, CustomerChange.ACTION_CREATED, created_changes(customer), user_creating)
 
         return customer
 
     def update(self, instance, validated_data):
+        old_values = snapshot(instance)
         instance.updated_by = self.context['request'].user
-        instance.name = validated_data.get('name', instance.name)
-        instance.surname = validated_data.get('surname', instance.surname)
-
-        if 'photo' in validated_data:
-            new_photo = validated_data.get('photo')
-            old_photo = instance.photo
-            # if photo is supplied in validated_data then delete the old photo (if there is one) from the S3 bucket
-            if old_photo:
-                s3_client = boto3.client(
-                    's3',
-                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                    endpoint_url=settings.AWS_S3_ENDPOINT_URL
-                )
-                s3_client.delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=old_photo.name)
-
-            instance.photo = new_photo
-
-        instance.save()
+        update_fields = ['updated_by']
+
+        for field_name in ('name', 'surname'):
+            if field_name in validated_data and validated_data[field_name] != getattr(instance, field_name):
+                setattr(instance, field_name, validated_data[field_name])
+                update_fields.append(field_name)
+
+        photo_changed = 'photo' in validated_data
+        old_photo = instance.photo.name
+        if photo_changed:
+            instance.photo = validated_data.get('photo')
+            update_fields.append('photo')
+
+        # only the changed columns are written, and only if the customer hasn't been changed since it was read. The
+        # change is recorded in the same transaction, which doesn't need a savepoint when it's nested in another one, as
+        # the conflict is handled inside it
+        with transaction.atomic(savepoint=False):
+            try:
+                instance.save_versioned(update_fields)
+            except Customer.VersionConflict:
+                conflict = True
+            else:
+                conflict = False
+                record_change(instance, CustomerChange.ACTION_UPDATED, diff(old_values, instance), instance.updated_by)
+
+        if conflict:
+            if photo_changed and instance.photo:
+                # the new photo has already been uploaded, but it won't be used
+                instance.photo.delete(save=False)
+            raise Conflict()
+
+        # if photo is supplied in validated_data then delete the old photo (if there is one) from the storage
+        if photo_changed and old_photo:
+            instance.photo.storage.delete(old_photo)
 
         return instance
 
@@ -59,4 +91,234 @@ class CustomerSerializer(serializers.ModelSerializer):
             elif uploaded_file.size > settings.MAX_PHOTO_UPLOAD_SIZE:
                 raise serializers.ValidationError({'photo': f'Trying to upload a photo that exceeds the maximum limit of {settings.MAX_PHOTO_UPLOAD_SIZE} bytes'})
 
-        return data
\ No newline at end of file
+        return data
+
+
+class CustomerDeactivationSerializer(serializers.Serializer):
+    """
+    Filters of the customers to deactivate, at least one of them is required
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False, max_length=10000)
+    created_by = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError('Filter the customers to deactivate by ids and/or created_by')
+        return data
+
+
+class ArchivedCustomerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedCustomer
+        fields = (
+            'id',
+            'name',
+            'surname',
+            'created_by',
+            'updated_by',
+            'deactivated_at',
+            'archived_at',
+        )
+        read_only_fields = fields
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    source = serializers.FileField(write_only=True, required=False)
+    source_key = serializers.CharField(write_only=True, required=False, max_length=255)
+    format = serializers.ChoiceField(choices=ImportJob.FORMAT_CHOICES, required=False)
+    rows_per_second = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = (
+            'id',
+            'source',
+            'source_key',
+            'format',
+            'status',
+            'created_by',
+            'created_at',
+            'started_at',
+            'finished_at',
+            'rows_processed',
+            'rows_created',
+            'rows_failed',
+            'rows_per_second',
+            'error',
+        )
+        read_only_fields = (
+            'status',
+            'created_by',
+            'created_at',
+            'started_at',
+            'finished_at',
+            'rows_processed',
+            'rows_created',
+            'rows_failed',
+            'error',
+        )
+
+    def get_rows_per_second(self, job):
+        if job.started_at is None:
+            return None
+
+        elapsed = ((job.finished_at or timezone.now()) - job.started_at).total_seconds()
+        return round(job.rows_processed / elapsed, 2) if elapsed > 0 else None
+
+    def create(self, validated_data):
+        job = ImportJob(created_by=self.context['request'].user, format=validated_data['format'])
+        if 'source' in validated_data:
+            job.source = validated_data['source']
+        else:
+            job.source.name = validated_data['source_key']
+        job.save()
+
+        return job
+
+    def validate(self, data):
+        if ('source' in data) == ('source_key' in data):
+            raise serializers.ValidationError('Either upload a source file or send the source_key of an uploaded one.')
+
+        if 'source_key' in data:
+            # only the files of the user's own folder, so the files of other users (or any other file in the bucket)
+            # can't be read through an import
+            prefix = import_key_prefix(self.context['request'].user)
+            source_key = data['source_key']
+            if not source_key.startswith(prefix) or posixpath.normpath(source_key) != source_key:
+                raise serializers.ValidationError({'source_key': f'Only the files uploaded to {prefix} can be imported.'})
+            if not default_storage.exists(source_key):
+                raise serializers.ValidationError({'source_key': 'The file does not exist.'})
+
+        if 'format' not in data:
+            filename = data['source'].name if 'source' in data else data['source_key']
+            file_extension = filename.split('.')[-1].lower()
+            if file_extension not in settings.IMPORT_FILE_EXTENSIONS:
+                raise serializers.ValidationError({'format': 'The format can not be guessed from the file name.'})
+            data['format'] = settings.IMPORT_FILE_EXTENSIONS[file_extension]
+
+        return data
+
+
+class ImportJobErrorSerializer(serializers.ModelSerializer):
+    errors = serializers.JSONField(source='decoded_errors')
+
+    class Meta:
+        model = ImportJobError
+        fields = (
+            'row',
+            'errors',
+        )
+
+
+class CustomerHistorySerializer(serializers.ModelSerializer):
+    changes = serializers.JSONField(source='decoded_changes')
+
+    class Meta:
+        model = CustomerHistory
+        fields = (
+            'id',
+            'action',
+            'changes',
+            'changed_by',
+            'changed_at',
+        )
+
+
+class CustomerValuesSerializer:
+    """
+    Read-only serializer for customer listings.
+
+    It outputs exactly what CustomerSerializer does, but it reads the rows with values_list() and converts each
+    column with a converter compiled once from CustomerSerializer's fields, instead of building a model instance and
+    going through the generic field machinery for every row.
+
+    The rows are the tuples of the queryset returned by `values()`.
+    """
+    serializer_class = CustomerSerializer
+    _plan = None
+
+    def __init__(self, rows, context=None):
+        self.rows = rows
+        self.context = context or {}
+
+    @classmethod
+    def values(cls, queryset, *extra_columns):
+        """
+        Returns the queryset's rows with the columns needed by the serializer, followed by the extra_columns.
+        The rows are named tuples, so the extra columns can be read by name (e.g. by a paginator)
+        """
+        return queryset.values_list(*cls.get_columns(), *extra_columns, named=True)
+
+    @classmethod
+    def get_plan(cls):
+        """
+        Returns a list of (field name, column, converter factory) for every readable field of the serializer
+        """
+        if cls._plan is None:
+            plan = []
+            model = cls.serializer_class.Meta.model
+            for field in cls.serializer_class().fields.values():
+                if field.write_only:
+                    continue
+                if field.source == '*' or '.' in field.source:
+                    raise ImproperlyConfigured(f'{cls.__name__} can not read the field "{field.field_name}" from a single column')
+
+                model_field = model._meta.get_field(field.source)
+                if isinstance(field, PrimaryKeyRelatedField):
+                    converter = cls.related_pk_converter
+                elif isinstance(field, serializers.FileField):
+                    converter = cls.file_converter
+                else:
+                    converter = cls.field_converter
+                plan.append((field.field_name, model_field.attname, converter(field, model_field)))
+            cls._plan = plan
+
+        return cls._plan
+
+    @classmethod
+    def get_columns(cls):
+        return [column for _, column, _ in cls.get_plan()]
+
+    @staticmethod
+    def field_converter(field, model_field):
+        return lambda context: field.to_representation
+
+    @staticmethod
+    def related_pk_converter(field, model_field):
+        if field.pk_field is None:
+            return lambda context: None
+        return lambda context: field.pk_field.to_representation
+
+    @staticmethod
+    def file_converter(field, model_field):
+        def make_converter(context):
+            if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+                return lambda name: name or None
+
+            storage = model_field.storage
+            request = context.get('request', None)
+            if request is None:
+                return lambda name: storage.url(name) if name else None
+            return lambda name: request.build_absolute_uri(storage.url(name)) if name else None
+
+        return make_converter
+
+    @property
+    def data(self):
+        plan = [
+            (field_name, index, make_converter(self.context))
+            for index, (field_name, _, make_converter) in enumerate(self.get_plan())
+        ]
+
+        ret = []
+        for row in self.rows:
+            item = OrderedDict()
+            for field_name, index, convert in plan:
+                value = row[index]
+                if value is None or convert is None:
+                    item[field_name] = value
+                else:
+                    item[field_name] = convert(value)
+            ret.append(item)
+
+        return ReturnList(ret, serializer=self)
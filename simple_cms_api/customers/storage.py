@@ -0,0 +1,120 @@
+"""
+Storages for the customer photos (and the import files). The one used is set with the DEFAULT_FILE_STORAGE setting:
+
+* customers.s3_storage.S3PhotoStorage: the S3 bucket, used in production
+* customers.storage.LocalPhotoStorage: MEDIA_ROOT on the local disk
+* customers.storage.InMemoryPhotoStorage: the memory of the process, for the tests and the benchmarks
+
+Besides Django's Storage API (save, open, delete, exists, url...) they all copy files inside the storage, delete many
+files at once, stream (ranges of) files and give presigned URLs.
+"""
+from urllib.parse import urljoin
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from django.utils.encoding import filepath_to_uri
+
+
+def read_chunks(file, start=0, end=None, chunk_size=64 * 1024):
+    """
+    Yields the bytes of the file from start to end (both included, up to the end of the file if end is None), one
+    chunk at a time
+    """
+    file.seek(start)
+    remaining = None if end is None else end - start + 1
+    while remaining is None or remaining > 0:
+        data = file.read(chunk_size if remaining is None else min(chunk_size, remaining))
+        if not data:
+            return
+        if remaining is not None:
+            remaining -= len(data)
+        yield data
+
+
+class PhotoStorageMixin:
+
+    def copy(self, name, new_name, storage_class=None):
+        """
+        Copies the file to new_name, replacing the file with that name if there is one. The storage class is only
+        used by S3
+        """
+        with self.open(name) as content:
+            self.delete(new_name)
+            self.save(new_name, content)
+
+    def delete_many(self, names):
+        for name in names:
+            self.delete(name)
+
+    def iter_chunks(self, name, start=0, end=None, chunk_size=64 * 1024):
+        """
+        Yields the bytes of the file from start to end (see read_chunks), without reading the whole file at once
+        """
+        with self.open(name) as file:
+            yield from read_chunks(file, start, end, chunk_size)
+
+    def presigned_url(self, name, expire=None):
+        """
+        URL to download the file without credentials, valid for `expire` seconds where the storage supports it
+        """
+        return self.url(name)
+
+
+@deconstructible
+class LocalPhotoStorage(PhotoStorageMixin, FileSystemStorage):
+    pass
+
+
+@deconstructible
+class InMemoryPhotoStorage(PhotoStorageMixin, Storage):
+    # shared by every instance, so the files are kept when the storage is instantiated again (e.g. by override_settings)
+    files = {}
+
+    def __init__(self, base_url=None):
+        self.base_url = settings.MEDIA_URL if base_url is None else base_url
+
+    @classmethod
+    def clear(cls):
+        cls.files.clear()
+
+    def _open(self, name, mode='rb'):
+        try:
+            content, _ = self.files[name]
+        except KeyError:
+            raise FileNotFoundError(f'{name} does not exist')
+        return ContentFile(content, name=name)
+
+    def _save(self, name, content):
+        self.files[name] = (b''.join(content.chunks()), timezone.now())
+        return name
+
+    def delete(self, name):
+        self.files.pop(name, None)
+
+    def exists(self, name):
+        return name in self.files
+
+    def size(self, name):
+        return len(self.files[name][0])
+
+    def listdir(self, path):
+        prefix = f'{path.rstrip("/")}/' if path else ''
+        directories, files = set(), []
+        for name in self.files:
+            if name.startswith(prefix):
+                directory, _, filename = name[len(prefix):].partition('/')
+                if filename:
+                    directories.add(directory)
+                else:
+                    files.append(directory)
+        return sorted(directories), sorted(files)
+
+    def url(self, name):
+        return urljoin(self.base_url, filepath_to_uri(name))
+
+    def get_modified_time(self, name):
+        return self.files[name][1]
+
+    get_created_time = get_accessed_time = get_modified_time
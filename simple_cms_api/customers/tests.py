@@ -1,14 +1,42 @@
 import datetime
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.client import encode_multipart
 from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
-import boto3
-from io import BytesIO
-from .models import Customer
+from rest_framework.renderers import JSONRenderer
+from rest_framework.parsers import JSONParser
+from rest_framework.test import APITestCase, APIRequestFactory
+from io import BytesIO, StringIO
+from unittest import mock
+from uuid import uuid4
+from simple_cms_api.compression import brotli, zstandard
+from simple_cms_api.middleware import CompressionMiddleware, ConcurrencyLimitMiddleware
+from simple_cms_api.renderers import FastJSONRenderer, FastJSONParser
+from simple_cms_api.throttling import ClientRateThrottle
+from users.models import Organization, Profile
+from users.serializers import UserSerializer
+from .models import ArchivedCustomer, Customer, CustomerChange, IdempotencyKey, ImportJob, import_key_prefix
+from .photos import PhotoCache
+from .serializers import CustomerSerializer, CustomerValuesSerializer
+from .storage import InMemoryPhotoStorage, LocalPhotoStorage
+from .views import CustomerDetail
+from oauth2_provider.oauth2_validators import OAuth2Validator
 from oauth2_provider.models import (
     get_access_token_model, get_application_model,
     get_grant_model, get_refresh_token_model
@@ -19,6 +47,7 @@ AccessToken = get_access_token_model()
 Application = get_application_model()
 
 
+@override_settings(DEFAULT_FILE_STORAGE='customers.storage.InMemoryPhotoStorage')
 class CustomerCreate(APITestCase):
 
     def setUp(self):
@@ -54,21 +83,9 @@ class CustomerCreate(APITestCase):
 
     def tearDown(self):
         """
-        Delete the customer's photo that has been uplaoded to the S3 bucket
-        """
-        try:
-            new_customer = Customer.objects.get(name=self.new_customer_data['name'])
-            if new_customer and new_customer.photo:
-                s3_client = boto3.client(
-                    's3',
-                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                    endpoint_url=settings.AWS_S3_ENDPOINT_URL
-                )
-                s3_client.delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=new_customer.photo.name)
-        except ObjectDoesNotExist:
-            # the customer was not created, so we don't need to delete the photo from the S3 bucket
-            pass
+        Delete the photos uploaded to the storage
+        """
+        InMemoryPhotoStorage.clear()
 
     def test_anonymous_user_create_customer_failure(self):
         """
@@ -171,6 +188,271 @@ class CustomerList(APITestCase):
         self.assertGreaterEqual(num_customers, 1)
 
 
+    def test_authenticated_user_list_customers_alphabetically(self):
+        """
+        Ensure customers can be paged alphabetically by surname and name, ignoring case and accents
+        """
+
+        for name, surname in [('Émile', 'Zola'), ('bob', 'alvarez'), ('Anna', 'Álvarez')]:
+            Customer.objects.create(name=name, surname=surname, created_by=self.normal_user)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        response = self.client.get(self.url, {'ordering': 'name', 'page_size': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([customer['name'] for customer in response.data['results']], ['Anna', 'bob'])
+
+        response = self.client.get(response.data['next'], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([customer['name'] for customer in response.data['results']], ['Émile'])
+        self.assertIsNone(response.data['next'])
+
+    def test_customer_sort_key_updated(self):
+        """
+        Ensure the sort key of a customer follows its name and surname
+        """
+
+        customer = Customer.objects.create(name='John', surname='Doe', created_by=self.normal_user)
+        self.assertEqual(customer.sort_key, 'doe\tjohn')
+
+        customer.surname = 'Dóe-Smith'
+        customer.save_versioned(['surname'])
+        self.assertEqual(Customer.objects.get(id=customer.id).sort_key, 'doe-smith\tjohn')
+
+class CustomerOrganizationScope(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('customers:customers-list')
+
+        self.organization = Organization.objects.create(name='my_test_organization')
+        self.other_organization = Organization.objects.create(name='my_test_other_organization')
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+        Profile.objects.create(user=self.normal_user, organization=self.organization)
+        self.other_user = UserModel.objects.create(
+            username='my_test_other_username',
+            password='my_test_other_password',
+            is_staff=False
+        )
+        Profile.objects.create(user=self.other_user, organization=self.other_organization)
+        self.application = Application.objects.create(
+            name="Test Application",
+            redirect_uris=("http://localhost"),
+            user=self.normal_user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        self.normal_user_accesstoken = AccessToken.objects.create(
+            user=self.normal_user,
+            token="1234567890",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+
+        self.customer = Customer.objects.create(
+            name='my_test_name',
+            surname='my_test_surname',
+            created_by=self.normal_user,
+            organization=self.organization
+        )
+        self.other_customer = Customer.objects.create(
+            name='my_test_other_name',
+            surname='my_test_other_surname',
+            created_by=self.other_user,
+            organization=self.other_organization
+        )
+
+    def test_authenticated_user_list_only_organization_customers(self):
+        """
+        Ensure a user only lists the customers of its organization
+        """
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([customer['id'] for customer in response.data], [self.customer.id])
+
+    def test_authenticated_user_retrieve_other_organization_customer_failure(self):
+        """
+        Ensure a user can't retrieve a customer of another organization
+        """
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        response = self.client.get(reverse('customers:customer-detail', args=[self.other_customer.id]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_authenticated_user_create_customer_in_organization(self):
+        """
+        Ensure a created customer belongs to the organization of the user that created it
+        """
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        response = self.client.post(self.url, {'name': 'my_new_name', 'surname': 'my_new_surname'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        new_customer = Customer.objects.get(id=response.data['id'])
+        self.assertEqual(new_customer.organization, self.organization)
+
+
+@override_settings(DEFAULT_FILE_STORAGE='customers.storage.InMemoryPhotoStorage')
+class CustomerValuesSerializerParity(APITestCase):
+
+    def setUp(self):
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+        Customer.objects.create(
+            name='my_test_name',
+            surname='my_test_surname',
+            photo=f'{settings.MEDIA_URL}/{uuid4().hex}.jpg',
+            created_by=self.normal_user,
+            updated_by=self.normal_user
+        )
+        Customer.objects.create(
+            name='my_test_name_without_photo',
+            surname='my_test_surname',
+            photo='',
+            created_by=self.normal_user
+        )
+        Customer.objects.create(
+            name='my_test_inactive_name',
+            surname='my_test_surname',
+            created_by=self.normal_user,
+            is_active=False
+        )
+
+    def test_values_serializer_output_is_identical(self):
+        """
+        Ensure the read-only listing serializer outputs exactly what CustomerSerializer does
+        """
+
+        request = APIRequestFactory().get(reverse('customers:customers-list'))
+        queryset = Customer.objects.order_by('id')
+        self.assertEqual(
+            CustomerValuesSerializer(CustomerValuesSerializer.values(queryset), context={'request': request}).data,
+            CustomerSerializer(queryset, many=True, context={'request': request}).data
+        )
+        self.assertEqual(
+            CustomerValuesSerializer(CustomerValuesSerializer.values(queryset)).data,
+            CustomerSerializer(queryset, many=True).data
+        )
+
+
+class CustomerThrottling(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('customers:customers-list')
+
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+        self.application = Application.objects.create(
+            name="Test Application",
+            redirect_uris=("http://localhost"),
+            user=self.normal_user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        self.normal_user_accesstoken = AccessToken.objects.create(
+            user=self.normal_user,
+            token="1234567890",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+        caches[settings.THROTTLE_CACHE].clear()
+
+    def tearDown(self):
+        caches[settings.THROTTLE_CACHE].clear()
+
+    def test_authenticated_user_throttled(self):
+        """
+        Ensure a client that used up its bucket gets a 429 with a Retry-After header
+        """
+
+        rest_framework_settings = {
+            **settings.REST_FRAMEWORK,
+            'DEFAULT_THROTTLE_RATES': {'client': '2/min', 'uploads': '1/min', 'bulk': '1/min'},
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        with override_settings(REST_FRAMEWORK=rest_framework_settings):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    def test_bulk_throttle_only_limits_starting_imports(self):
+        """
+        Ensure the bulk rate limits starting import jobs, but not listing them
+        """
+
+        rest_framework_settings = {
+            **settings.REST_FRAMEWORK,
+            'DEFAULT_THROTTLE_RATES': {'client': '10/min', 'uploads': '10/min', 'bulk': '1/min'},
+        }
+        url = reverse('customers:import-list')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        with override_settings(REST_FRAMEWORK=rest_framework_settings):
+            for _ in range(3):
+                self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+            self.assertEqual(self.client.post(url, {}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+            response = self.client.post(url, {}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_concurrent_requests_spend_each_token_once(self):
+        """
+        Ensure the concurrent requests of a client don't spend the same token of its bucket
+        """
+
+        rest_framework_settings = {
+            **settings.REST_FRAMEWORK,
+            'DEFAULT_THROTTLE_RATES': {'client': '5/min', 'uploads': '1/min', 'bulk': '1/min'},
+        }
+        request = RequestFactory().get(self.url)
+        request.user, request.auth = self.normal_user, None
+        with override_settings(REST_FRAMEWORK=rest_framework_settings), ThreadPoolExecutor(max_workers=10) as executor:
+            throttles = [ClientRateThrottle() for _ in range(20)]
+            allowed = list(executor.map(lambda throttle: throttle.allow_request(request, None), throttles))
+
+            self.assertEqual(allowed.count(True), 5)
+
+            # a request that can't get the lock of its bucket is throttled
+            caches[settings.THROTTLE_CACHE].clear()
+            throttle = ClientRateThrottle()
+            caches[settings.THROTTLE_CACHE].add(f'{throttle.get_cache_key(request, None)}_lock', True)
+            with override_settings(THROTTLE_LOCK_WAIT=0):
+                self.assertFalse(throttle.allow_request(request, None))
+            self.assertGreater(throttle.wait(), 0)
+
+    def test_concurrency_limit_sheds_requests(self):
+        """
+        Ensure requests over the concurrency limit are rejected straight away with a 503
+        """
+
+        with override_settings(MAX_CONCURRENT_REQUESTS=1):
+            middleware = ConcurrencyLimitMiddleware(lambda request: HttpResponse())
+
+        request = RequestFactory().get(self.url)
+        middleware.semaphore.acquire()
+        response = middleware(request)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', response)
+
+        middleware.semaphore.release()
+        self.assertEqual(middleware(request).status_code, status.HTTP_200_OK)
+
+
+@override_settings(DEFAULT_FILE_STORAGE='customers.storage.InMemoryPhotoStorage')
 class CustomerRetrieveUpdateDestroy(APITestCase):
 
     def setUp(self):
@@ -206,21 +488,9 @@ class CustomerRetrieveUpdateDestroy(APITestCase):
 
     def tearDown(self):
         """
-        Delete the customer's photo that has been uplaoded to the S3 bucket
-        """
-        try:
-            new_customer = Customer.objects.get(id=self.customer_to_edit.id)
-            if new_customer and new_customer.photo:
-                s3_client = boto3.client(
-                    's3',
-                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                    endpoint_url=settings.AWS_S3_ENDPOINT_URL
-                )
-                s3_client.delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=new_customer.photo.name)
-        except ObjectDoesNotExist:
-            # the customer was not created, so we don't need to delete the photo from the S3 bucket
-            pass
+        Delete the photos uploaded to the storage
+        """
+        InMemoryPhotoStorage.clear()
 
     def test_anonymous_user_retrieve_customers_failure(self):
         """
@@ -321,6 +591,72 @@ class CustomerRetrieveUpdateDestroy(APITestCase):
         updated_customer = Customer.objects.get(id=self.customer_to_edit.id)
         self.assertEqual(updated_customer.updated_by, self.normal_user)
 
+    def test_authenticated_user_retrieve_customer_etag(self):
+        """
+        Ensure a retrieved customer has an ETag with its version
+        """
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], f'"{self.customer_to_edit.version}"')
+
+    def test_authenticated_user_patch_update_customer_with_matching_version(self):
+        """
+        Ensure a customer can be updated with the If-Match header of its current version, and its version increases
+        """
+
+        edit_customer_data = {
+            'name': 'edited_name'
+        }
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        response = self.client.patch(self.url, edit_customer_data, format='json',
+                                     HTTP_IF_MATCH=f'"{self.customer_to_edit.version}"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['version'], self.customer_to_edit.version + 1)
+
+        updated_customer = Customer.objects.get(id=self.customer_to_edit.id)
+        self.assertEqual(updated_customer.version, self.customer_to_edit.version + 1)
+        self.assertEqual(response['ETag'], f'"{updated_customer.version}"')
+
+    def test_authenticated_user_patch_update_customer_with_stale_version_failure(self):
+        """
+        Ensure a customer can't be updated with the If-Match header of an old version
+        """
+
+        edit_customer_data = {
+            'name': 'edited_name'
+        }
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        self.client.patch(self.url, {'surname': 'edited_surname'}, format='json')
+        response = self.client.patch(self.url, edit_customer_data, format='json',
+                                     HTTP_IF_MATCH=f'"{self.customer_to_edit.version}"')
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        # check that the customer's name hasn't changed
+        updated_customer = Customer.objects.get(id=self.customer_to_edit.id)
+        self.assertEqual(updated_customer.name, self.customer_to_edit.name)
+
+    def test_concurrent_update_customer_conflict(self):
+        """
+        Ensure an update based on a customer that has been changed after it was read doesn't overwrite the change
+        """
+
+        first_read = Customer.objects.get(id=self.customer_to_edit.id)
+        second_read = Customer.objects.get(id=self.customer_to_edit.id)
+
+        first_read.name = 'first_name'
+        first_read.save_versioned(['name'])
+        second_read.surname = 'second_surname'
+        with self.assertRaises(Customer.VersionConflict):
+            second_read.save_versioned(['surname'])
+
+        updated_customer = Customer.objects.get(id=self.customer_to_edit.id)
+        self.assertEqual(updated_customer.name, 'first_name')
+        self.assertEqual(updated_customer.surname, self.customer_to_edit.surname)
+
     def test_authenticated_user_put_update_customer_image_name_changed(self):
         """
         Ensure that a customer's photo filename is changed when the customer is created
@@ -341,3 +677,1233 @@ class CustomerRetrieveUpdateDestroy(APITestCase):
         # check that the customer photo filename changed
         updated_customer = Customer.objects.get(id=self.customer_to_edit.id)
         self.assertNotEqual(updated_customer.photo.name, self.customer_to_edit.photo.name)
+
+    def test_authenticated_user_put_update_customer_old_photo_deleted(self):
+        """
+        Ensure that the old photo of a customer is deleted from the storage when it's replaced
+        """
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        photo_names = []
+        for content in (b'my_first_photo', b'my_second_photo'):
+            img = BytesIO(content)
+            img.name = 'myimage.jpg'
+            response = self.client.put(self.url, {'name': 'edited_name', 'surname': 'edited_surname', 'photo': img}, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            photo_names.append(Customer.objects.get(id=self.customer_to_edit.id).photo.name)
+
+        self.assertEqual(list(InMemoryPhotoStorage.files), [photo_names[1]])
+
+
+@override_settings(DEFAULT_FILE_STORAGE='customers.storage.InMemoryPhotoStorage')
+class FastJSONRendererParity(APITestCase):
+
+    def setUp(self):
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False,
+            last_login=timezone.now()
+        )
+        Customer.objects.create(
+            name='my_test_name',
+            surname='my_test_surname \u2028 ñ',
+            photo=f'{settings.MEDIA_URL}/{uuid4().hex}.jpg',
+            created_by=self.normal_user,
+            updated_by=self.normal_user
+        )
+        Customer.objects.create(
+            name='my_test_name_without_photo',
+            surname='my_test_surname',
+            created_by=self.normal_user
+        )
+
+    def test_fast_renderer_output_is_identical(self):
+        """
+        Ensure the orjson backed renderer outputs the same bytes as DRF's JSONRenderer for customers and users
+        """
+
+        payloads = [
+            CustomerSerializer(Customer.objects.all(), many=True).data,
+            UserSerializer(UserModel.objects.all(), many=True).data,
+            {'date': timezone.now(), 'uuid': uuid4(), 'nothing': None},
+        ]
+        for data in payloads:
+            self.assertEqual(
+                FastJSONRenderer().render(data, 'application/json'),
+                JSONRenderer().render(data, 'application/json')
+            )
+
+    def test_fast_parser_output_is_identical(self):
+        """
+        Ensure the orjson backed parser parses the same data as DRF's JSONParser
+        """
+
+        content = JSONRenderer().render(CustomerSerializer(Customer.objects.all(), many=True).data)
+        self.assertEqual(
+            FastJSONParser().parse(BytesIO(content)),
+            JSONParser().parse(BytesIO(content))
+        )
+
+
+@override_settings(DEFAULT_FILE_STORAGE='customers.storage.InMemoryPhotoStorage')
+class CustomerImport(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('customers:import-list')
+
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+        self.application = Application.objects.create(
+            name="Test Application",
+            redirect_uris=("http://localhost"),
+            user=self.normal_user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        self.normal_user_accesstoken = AccessToken.objects.create(
+            user=self.normal_user,
+            token="1234567890",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+
+    def tearDown(self):
+        """
+        Delete the imported files that have been uploaded to the storage
+        """
+        for job in ImportJob.objects.all():
+            job.source.delete(save=False)
+
+    def upload(self, content, filename):
+        source = BytesIO(content)
+        source.name = filename
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        return self.client.post(self.url, {'source': source}, format='multipart')
+
+    def test_anonymous_user_create_import_failure(self):
+        """
+        Ensure an anonymous user can't import customers
+        """
+
+        response = self.client.post(self.url, {}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_authenticated_user_import_csv(self):
+        """
+        Ensure the customers of an uploaded CSV file are created by the worker, and the invalid rows reported
+        """
+
+        response = self.upload(b'name,surname\nJohn,Doe\n,Nameless\nJane,Doe\n', 'customers.csv')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], ImportJob.STATUS_PENDING)
+        self.assertEqual(response.data['format'], ImportJob.FORMAT_CSV)
+
+        call_command('process_customer_imports', once=True, chunk_size=2, stdout=StringIO())
+
+        response = self.client.get(reverse('customers:import-detail', args=[response.data['id']]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], ImportJob.STATUS_COMPLETED)
+        self.assertEqual(response.data['rows_created'], 2)
+        self.assertEqual(response.data['rows_failed'], 1)
+        self.assertIsNotNone(response.data['rows_per_second'])
+
+        # check that the customers were created by the user that uploaded the file
+        self.assertEqual(
+            list(Customer.objects.order_by('id').values_list('name', 'created_by')),
+            [('John', self.normal_user.id), ('Jane', self.normal_user.id)]
+        )
+
+        # check that the invalid row is reported
+        response = self.client.get(reverse('customers:import-error-list', args=[response.data['id']]), format='json')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['row'], 2)
+        self.assertIn('name', response.data['results'][0]['errors'])
+
+    def test_authenticated_user_import_ndjson(self):
+        """
+        Ensure the customers of an uploaded NDJSON file are created by the worker
+        """
+
+        response = self.upload(b'{"name": "John", "surname": "Doe"}\nnot json\n{"name": "Jane", "surname": "Doe"}', 'customers.ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        call_command('process_customer_imports', once=True, stdout=StringIO())
+
+        job = ImportJob.objects.get(id=response.data['id'])
+        self.assertEqual(job.status, ImportJob.STATUS_COMPLETED)
+        self.assertEqual((job.rows_created, job.rows_failed), (2, 1))
+
+    def test_resume_import_of_crashed_worker(self):
+        """
+        Ensure a job whose worker stopped making progress is resumed after its last committed row
+        """
+
+        response = self.upload(b'name,surname\nJohn,Doe\nJane,Doe\nJim,Doe\n', 'customers.csv')
+        ImportJob.objects.filter(id=response.data['id']).update(
+            status=ImportJob.STATUS_RUNNING,
+            started_at=timezone.now() - datetime.timedelta(hours=1),
+            heartbeat_at=timezone.now() - datetime.timedelta(hours=1),
+            rows_processed=2,
+            rows_created=2
+        )
+
+        call_command('process_customer_imports', once=True, stdout=StringIO())
+
+        job = ImportJob.objects.get(id=response.data['id'])
+        self.assertEqual(job.status, ImportJob.STATUS_COMPLETED)
+        self.assertEqual((job.rows_processed, job.rows_created), (3, 3))
+        self.assertEqual(list(Customer.objects.values_list('name', flat=True)), ['Jim'])
+
+
+    def test_authenticated_user_import_source_key(self):
+        """
+        Ensure a file already in the bucket can be imported by its key, only if it's in the user's folder
+        """
+
+        prefix = import_key_prefix(self.normal_user)
+        own_key = default_storage.save(f'{prefix}customers.csv', ContentFile(b'name,surname\nJohn,Doe\n'))
+        other_key = default_storage.save(f'{settings.IMPORTS_URL}user-0/customers.csv', ContentFile(b'name,surname\n'))
+        self.addCleanup(default_storage.delete, other_key)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        for source_key in (
+            other_key,
+            f'{settings.MEDIA_URL}photo.csv',
+            f'{prefix}../user-0/customers.csv',
+        ):
+            response = self.client.post(self.url, {'source_key': source_key}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, source_key)
+            self.assertIn('source_key', response.data)
+
+        response = self.client.post(self.url, {'source_key': own_key}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        call_command('process_customer_imports', once=True, stdout=StringIO())
+        self.assertEqual(ImportJob.objects.get(id=response.data['id']).rows_created, 1)
+
+
+@override_settings(DEFAULT_FILE_STORAGE='customers.storage.InMemoryPhotoStorage')
+class CustomerArchive(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('customers:archived-customer-list')
+
+        self.organization = Organization.objects.create(name='my_test_organization')
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+        Profile.objects.create(user=self.normal_user, organization=self.organization)
+        self.application = Application.objects.create(
+            name="Test Application",
+            redirect_uris=("http://localhost"),
+            user=self.normal_user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        self.normal_user_accesstoken = AccessToken.objects.create(
+            user=self.normal_user,
+            token="1234567890",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+
+        self.customer = Customer.objects.create(
+            name='my_test_name',
+            surname='my_test_surname',
+            created_by=self.normal_user,
+            organization=self.organization
+        )
+        self.recent_customer = Customer.objects.create(
+            name='my_test_recent_name',
+            surname='my_test_recent_surname',
+            created_by=self.normal_user,
+            organization=self.organization
+        )
+
+    def tearDown(self):
+        """
+        Delete the photos uploaded to the storage
+        """
+        InMemoryPhotoStorage.clear()
+
+    def delete(self, customer, days_ago):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        response = self.client.delete(reverse('customers:customer-detail', args=[customer.id]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        Customer._base_manager.filter(id=customer.id).update(
+            deactivated_at=timezone.now() - datetime.timedelta(days=days_ago)
+        )
+
+    def test_deleted_customer_deactivated_at(self):
+        """
+        Ensure deleting a customer records when it was deactivated
+        """
+
+        self.delete(self.customer, days_ago=0)
+        customer = Customer._base_manager.get(id=self.customer.id)
+        self.assertFalse(customer.is_active)
+        self.assertIsNotNone(customer.deactivated_at)
+
+    def test_archive_customers_after_retention_period(self):
+        """
+        Ensure only the customers deleted before the retention period are archived, keeping their id
+        """
+
+        self.delete(self.customer, days_ago=settings.CUSTOMER_ARCHIVE_RETENTION_DAYS + 1)
+        self.delete(self.recent_customer, days_ago=1)
+
+        out = StringIO()
+        call_command('archive_customers', batch_size=1, stdout=out)
+        self.assertIn('Archived 1 customers', out.getvalue())
+
+        self.assertFalse(Customer._base_manager.filter(id=self.customer.id).exists())
+        self.assertTrue(Customer._base_manager.filter(id=self.recent_customer.id).exists())
+        archived_customer = ArchivedCustomer.objects.get(id=self.customer.id)
+        self.assertEqual(archived_customer.organization, self.organization)
+
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([customer['id'] for customer in response.data['results']], [self.customer.id])
+
+    def test_authenticated_user_restore_archived_customer(self):
+        """
+        Ensure an archived customer is restored as an active customer with the same id
+        """
+
+        self.delete(self.customer, days_ago=settings.CUSTOMER_ARCHIVE_RETENTION_DAYS + 1)
+        call_command('archive_customers', stdout=StringIO())
+
+        response = self.client.post(reverse('customers:archived-customer-restore', args=[self.customer.id]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['id'], self.customer.id)
+        self.assertEqual(response['ETag'], '"%s"' % response.data['version'])
+
+        customer = Customer.objects.get(id=self.customer.id)
+        self.assertIsNone(customer.deactivated_at)
+        self.assertFalse(ArchivedCustomer.objects.filter(id=self.customer.id).exists())
+
+        # restoring it again fails
+        response = self.client.post(reverse('customers:archived-customer-restore', args=[self.customer.id]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_archive_and_restore_customer_photo(self):
+        """
+        Ensure the photo of a customer is moved to the archive folder when it's archived, and back when it's restored
+        """
+
+        self.customer.photo.save('myimage.jpg', ContentFile(b'mybinarydata'))
+        photo_name = self.customer.photo.name
+        archived_photo_name = f'{settings.CUSTOMER_ARCHIVE_PHOTO_PREFIX}{photo_name}'
+
+        self.delete(self.customer, days_ago=settings.CUSTOMER_ARCHIVE_RETENTION_DAYS + 1)
+        call_command('archive_customers', stdout=StringIO())
+        self.assertEqual(ArchivedCustomer.objects.get(id=self.customer.id).photo, archived_photo_name)
+        self.assertEqual(list(InMemoryPhotoStorage.files), [archived_photo_name])
+
+        response = self.client.post(reverse('customers:archived-customer-restore', args=[self.customer.id]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Customer.objects.get(id=self.customer.id).photo.name, photo_name)
+        self.assertEqual(list(InMemoryPhotoStorage.files), [photo_name])
+        self.assertEqual(default_storage.open(photo_name).read(), b'mybinarydata')
+
+    def test_archive_photos_copied_before_locking(self):
+        """
+        Ensure the photos are copied outside of the archiving transaction, and a customer restored in the meantime is
+        not archived
+        """
+
+        self.customer.photo.save('myimage.jpg', ContentFile(b'mybinarydata'))
+        self.recent_customer.photo.save('myotherimage.jpg', ContentFile(b'myotherbinarydata'))
+        self.delete(self.customer, days_ago=settings.CUSTOMER_ARCHIVE_RETENTION_DAYS + 1)
+        self.delete(self.recent_customer, days_ago=settings.CUSTOMER_ARCHIVE_RETENTION_DAYS + 1)
+
+        atomic_blocks = len(connection.savepoint_ids)
+        copy = default_storage.copy
+
+        def copy_and_restore(source, destination, storage_class):
+            self.assertEqual(len(connection.savepoint_ids), atomic_blocks)
+            Customer._base_manager.filter(id=self.recent_customer.id).update(is_active=True, deactivated_at=None)
+            copy(source, destination, storage_class)
+
+        with mock.patch.object(default_storage, 'copy', side_effect=copy_and_restore) as mocked_copy:
+            call_command('archive_customers', stdout=StringIO())
+        self.assertEqual(mocked_copy.call_count, 2)
+
+        self.assertEqual(list(ArchivedCustomer.objects.values_list('id', flat=True)), [self.customer.id])
+        self.assertEqual(Customer.objects.get(id=self.recent_customer.id).photo.name, self.recent_customer.photo.name)
+        self.assertIn(self.recent_customer.photo.name, InMemoryPhotoStorage.files)
+        self.assertNotIn(self.customer.photo.name, InMemoryPhotoStorage.files)
+
+    def test_authenticated_user_restore_other_organization_customer_failure(self):
+        """
+        Ensure a user can't restore an archived customer of another organization
+        """
+
+        other_organization = Organization.objects.create(name='my_test_other_organization')
+        Customer._base_manager.filter(id=self.customer.id).update(
+            organization=other_organization,
+            is_active=False,
+            deactivated_at=timezone.now() - datetime.timedelta(days=settings.CUSTOMER_ARCHIVE_RETENTION_DAYS + 1)
+        )
+        call_command('archive_customers', stdout=StringIO())
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        response = self.client.post(reverse('customers:archived-customer-restore', args=[self.customer.id]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CustomerHistoryLog(APITestCase):
+
+    def setUp(self):
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+        self.application = Application.objects.create(
+            name="Test Application",
+            redirect_uris=("http://localhost"),
+            user=self.normal_user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        self.normal_user_accesstoken = AccessToken.objects.create(
+            user=self.normal_user,
+            token="1234567890",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        response = self.client.post(reverse('customers:customers-list'), {'name': 'John', 'surname': 'Doe'}, format='json')
+        self.customer = Customer.objects.get(id=response.data['id'])
+        self.url = reverse('customers:customer-history', args=[self.customer.id])
+
+    def test_customer_changes_recorded_in_outbox(self):
+        """
+        Ensure every change of a customer is appended to the outbox with the fields that changed
+        """
+
+        self.client.patch(reverse('customers:customer-detail', args=[self.customer.id]), {'name': 'Johnny'}, format='json')
+        self.client.delete(reverse('customers:customer-detail', args=[self.customer.id]), format='json')
+
+        changes = list(CustomerChange.objects.order_by('id'))
+        self.assertEqual([change.action for change in changes], ['created', 'updated', 'deleted'])
+        self.assertEqual(json.loads(changes[0].changes), {'name': [None, 'John'], 'surname': [None, 'Doe']})
+        self.assertEqual(json.loads(changes[1].changes), {'name': ['John', 'Johnny']})
+        self.assertEqual(json.loads(changes[2].changes), {'is_active': [True, False]})
+        self.assertEqual({change.changed_by_id for change in changes}, {self.normal_user.id})
+
+    def test_conflicting_update_not_recorded(self):
+        """
+        Ensure an update rejected because the customer was changed between its read and its write doesn't record a
+        change
+        """
+
+        get_object = CustomerDetail.get_object
+
+        def get_object_changed_concurrently(view):
+            customer = get_object(view)
+            Customer.objects.filter(id=customer.id).update(version=F('version') + 1)
+            return customer
+
+        with mock.patch.object(CustomerDetail, 'get_object', autospec=True, side_effect=get_object_changed_concurrently):
+            response = self.client.patch(
+                reverse('customers:customer-detail', args=[self.customer.id]),
+                {'name': 'Johnny'},
+                format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Customer.objects.get(id=self.customer.id).name, 'John')
+        self.assertEqual([change.action for change in CustomerChange.objects.all()], [CustomerChange.ACTION_CREATED])
+
+    def test_authenticated_user_list_customer_history(self):
+        """
+        Ensure the relayed changes of a customer are listed newest first, one page at a time
+        """
+
+        for name in ('Johnny', 'Jonathan'):
+            self.client.patch(reverse('customers:customer-detail', args=[self.customer.id]), {'name': name}, format='json')
+
+        out = StringIO()
+        call_command('relay_customer_changes', once=True, batch_size=2, stdout=out)
+        self.assertIn('Relayed 3 customer changes', out.getvalue())
+        self.assertFalse(CustomerChange.objects.exists())
+
+        response = self.client.get(self.url, {'page_size': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([change['changes'] for change in response.data['results']], [
+            {'name': ['Johnny', 'Jonathan']},
+            {'name': ['John', 'Johnny']},
+        ])
+        self.assertEqual(response.data['results'][0]['changed_by'], self.normal_user.id)
+
+        response = self.client.get(response.data['next'], format='json')
+        self.assertEqual([change['action'] for change in response.data['results']], ['created'])
+        self.assertIsNone(response.data['next'])
+
+    def test_authenticated_user_list_other_organization_customer_history_failure(self):
+        """
+        Ensure a user can't read the history of a customer of another organization
+        """
+
+        Customer.objects.filter(id=self.customer.id).update(organization=Organization.objects.create(name='my_test_organization'))
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ApiOnlySettings(APITestCase):
+
+    def test_api_only_process_starts_without_boto3(self):
+        """
+        Ensure a process with the API-only settings loads every view without importing boto3 or the admin panel's URLs
+        """
+
+        out = StringIO()
+        call_command(
+            'measure_startup',
+            settings_modules=['simple_cms_api.settings_api'],
+            repeat=1,
+            top=0,
+            stdout=out
+        )
+        self.assertIn('simple_cms_api.settings_api: startup=', out.getvalue())
+        self.assertNotIn('boto3', out.getvalue())
+
+
+class BearerTokenFastPath(APITestCase):
+
+    def setUp(self):
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+        self.application = Application.objects.create(
+            name="Test Application",
+            redirect_uris=("http://localhost"),
+            user=self.normal_user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        self.normal_user_accesstoken = AccessToken.objects.create(
+            user=self.normal_user,
+            token="1234567890",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+        self.customer = Customer.objects.create(
+            name='my_test_name',
+            surname='my_test_surname',
+            created_by=self.normal_user
+        )
+        self.url = reverse('customers:customer-detail', args=[self.customer.id])
+
+    def test_bearer_token_validated_once(self):
+        """
+        Ensure the token of a bearer token API request is only validated once
+        """
+
+        validate_bearer_token = OAuth2Validator.validate_bearer_token
+        with mock.patch.object(OAuth2Validator, 'validate_bearer_token', autospec=True, side_effect=validate_bearer_token) as validate:
+            self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+            response = self.client.get(self.url, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(validate.call_count, 1)
+
+    def test_bearer_token_request_skips_browser_middleware(self):
+        """
+        Ensure bearer token API requests skip the session and frame options middleware, and vary on Authorization
+        """
+
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'my_test_session_key'
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        response = self.client.get(self.url, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Frame-Options', response)
+        self.assertIn('Authorization', response['Vary'])
+
+    def test_invalid_bearer_token_failure(self):
+        """
+        Ensure a request with an invalid bearer token is rejected
+        """
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer my_invalid_token')
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertTrue(response['WWW-Authenticate'].startswith('Bearer'))
+
+
+class CustomerDeactivation(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('customers:customers-deactivate')
+
+        self.organization = Organization.objects.create(name='my_test_organization')
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+        Profile.objects.create(user=self.normal_user, organization=self.organization)
+        self.other_user = UserModel.objects.create(
+            username='my_test_other_username',
+            password='my_test_other_password',
+            is_staff=False
+        )
+        Profile.objects.create(user=self.other_user, organization=self.organization)
+        self.application = Application.objects.create(
+            name="Test Application",
+            redirect_uris=("http://localhost"),
+            user=self.normal_user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        self.normal_user_accesstoken = AccessToken.objects.create(
+            user=self.normal_user,
+            token="1234567890",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+
+        self.customers = [
+            Customer.objects.create(
+                name=f'my_test_name_{i}',
+                surname='my_test_surname',
+                created_by=self.other_user if i < 5 else self.normal_user,
+                organization=self.organization
+            )
+            for i in range(7)
+        ]
+        self.other_organization_customer = Customer.objects.create(
+            name='my_test_other_name',
+            surname='my_test_other_surname',
+            created_by=self.other_user
+        )
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+
+    def test_authenticated_user_delete_customer_with_stale_version_failure(self):
+        """
+        Ensure a customer is not deleted if the If-Match header doesn't match its version
+        """
+
+        url = reverse('customers:customer-detail', args=[self.customers[0].id])
+        response = self.client.delete(url, format='json', HTTP_IF_MATCH='"3"')
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        response = self.client.delete(url, format='json', HTTP_IF_MATCH='"0"')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        customer = Customer.all_objects.get(id=self.customers[0].id)
+        self.assertFalse(customer.is_active)
+        self.assertEqual((customer.version, customer.updated_by), (1, self.normal_user))
+
+        response = self.client.delete(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_authenticated_user_delete_customer_with_invalid_etag_failure(self):
+        """
+        Ensure a customer is not deleted if the If-Match header has none of its ETags
+        """
+
+        url = reverse('customers:customer-detail', args=[self.customers[0].id])
+        for if_match in ('"abc"', 'W/"abc", "v1"', ''):
+            response = self.client.delete(url, format='json', HTTP_IF_MATCH=if_match)
+            self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED, if_match)
+
+        response = self.client.patch(url, {'name': 'edited_name'}, format='json', HTTP_IF_MATCH='"abc"')
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertTrue(Customer.objects.filter(id=self.customers[0].id, version=0).exists())
+
+    def test_authenticated_user_deactivate_customers_created_by_user(self):
+        """
+        Ensure all the customers created by a user are deactivated in chunks, and their changes recorded
+        """
+
+        with override_settings(CUSTOMER_DEACTIVATION_CHUNK_SIZE=2):
+            response = self.client.post(self.url, {'created_by': self.other_user.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'deactivated': 5})
+
+        self.assertEqual(
+            set(Customer.objects.values_list('id', flat=True)),
+            {customer.id for customer in self.customers[5:]} | {self.other_organization_customer.id}
+        )
+        self.assertEqual(
+            CustomerChange.objects.filter(action=CustomerChange.ACTION_DELETED, changed_by_id=self.normal_user.id).count(),
+            5
+        )
+
+    def test_authenticated_user_deactivate_customers_by_id(self):
+        """
+        Ensure only the customers of the user's organization are deactivated by id
+        """
+
+        ids = [self.customers[0].id, self.other_organization_customer.id]
+        response = self.client.post(self.url, {'ids': ids}, format='json')
+        self.assertEqual(response.data, {'deactivated': 1})
+        self.assertTrue(Customer.objects.filter(id=self.other_organization_customer.id).exists())
+
+    def test_authenticated_user_deactivate_customers_without_filters_failure(self):
+        """
+        Ensure the customers to deactivate must be filtered
+        """
+
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Customer.objects.count(), 8)
+
+
+class ResponseCompression(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('customers:customers-list')
+
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+        self.application = Application.objects.create(
+            name="Test Application",
+            redirect_uris=("http://localhost"),
+            user=self.normal_user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        self.normal_user_accesstoken = AccessToken.objects.create(
+            user=self.normal_user,
+            token="1234567890",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+        Customer.objects.bulk_create([
+            Customer(name=f'my_test_name_{i}', surname='my_test_surname', created_by=self.normal_user)
+            for i in range(50)
+        ])
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+
+    def test_list_customers_gzip(self):
+        """
+        Ensure a customer listing is compressed with gzip for the clients that only accept gzip
+        """
+
+        response = self.client.get(self.url, format='json', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))), 50)
+
+    @unittest.skipIf(brotli is None or zstandard is None, 'brotli and zstandard are not installed')
+    def test_list_customers_preferred_encoding(self):
+        """
+        Ensure the encoding the client prefers is used, and the encodings it doesn't accept are not
+        """
+
+        response = self.client.get(self.url, format='json', HTTP_ACCEPT_ENCODING='gzip;q=0.5, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(len(json.loads(brotli.decompress(response.content))), 50)
+
+        response = self.client.get(self.url, format='json', HTTP_ACCEPT_ENCODING='gzip, br, zstd')
+        self.assertEqual(response['Content-Encoding'], 'zstd')
+
+        response = self.client.get(self.url, format='json', HTTP_ACCEPT_ENCODING='*, zstd;q=0, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_small_or_unaccepted_responses_not_compressed(self):
+        """
+        Ensure responses under the size threshold, or for clients that don't accept compression, are not compressed
+        """
+
+        response = self.client.get(self.url, format='json')
+        self.assertNotIn('Content-Encoding', response)
+
+        with override_settings(COMPRESSION_MIN_SIZE=1000000):
+            response = self.client.get(self.url, format='json', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_streaming_response_compressed_by_chunks(self):
+        """
+        Ensure streaming responses are compressed chunk by chunk, and their strong ETags made weak
+        """
+
+        chunks = [json.dumps({'row': i}).encode() * 100 for i in range(10)]
+
+        def get_response(request):
+            response = StreamingHttpResponse(iter(chunks))
+            response['ETag'] = '"my_test_etag"'
+            return response
+
+        response = CompressionMiddleware(get_response)(RequestFactory().get(self.url, HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"my_test_etag"')
+        compressed = list(response.streaming_content)
+        self.assertGreater(len(compressed), 1)
+        self.assertEqual(gzip.decompress(b''.join(compressed)), b''.join(chunks))
+
+
+class CustomerBatchRetrieve(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('customers:customers-list')
+
+        self.organization = Organization.objects.create(name='my_test_organization')
+        self.other_organization = Organization.objects.create(name='my_test_other_organization')
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+        Profile.objects.create(user=self.normal_user, organization=self.organization)
+        self.other_user = UserModel.objects.create(
+            username='my_test_other_username',
+            password='my_test_other_password',
+            is_staff=False
+        )
+        Profile.objects.create(user=self.other_user, organization=self.other_organization)
+        self.application = Application.objects.create(
+            name="Test Application",
+            redirect_uris=("http://localhost"),
+            user=self.normal_user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        self.normal_user_accesstoken = AccessToken.objects.create(
+            user=self.normal_user,
+            token="1234567890",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+
+        self.customers = [
+            Customer.objects.create(
+                name=f'my_test_name_{i}',
+                surname='my_test_surname',
+                created_by=self.normal_user,
+                organization=self.organization
+            )
+            for i in range(3)
+        ]
+        self.inactive_customer = Customer.objects.create(
+            name='my_test_inactive_name',
+            surname='my_test_surname',
+            created_by=self.normal_user,
+            organization=self.organization,
+            is_active=False
+        )
+        self.other_customer = Customer.objects.create(
+            name='my_test_other_name',
+            surname='my_test_other_surname',
+            created_by=self.other_user,
+            organization=self.other_organization
+        )
+
+    def test_authenticated_user_retrieve_customers_by_id(self):
+        """
+        Ensure a user retrieves the requested customers with a single query, in the order they were requested
+        """
+
+        ids = [self.customers[2].id, self.customers[0].id, self.customers[1].id, self.customers[0].id]
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        queries = []
+
+        def record_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record_query):
+            response = self.client.get(self.url, {'ids': ','.join(map(str, ids))}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([customer['id'] for customer in response.data['results']], ids[:3])
+        self.assertEqual(response.data['results'][0], CustomerSerializer(self.customers[2]).data)
+        self.assertEqual(response.data['missing'], [])
+        self.assertEqual(len([query for query in queries if 'customers_customer' in query]), 1)
+
+    def test_authenticated_user_retrieve_missing_customers_by_id(self):
+        """
+        Ensure the ids of unknown, deleted and other organization customers are reported as missing
+        """
+
+        ids = [self.customers[0].id, self.inactive_customer.id, self.other_customer.id, 999999]
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        response = self.client.get(self.url, {'ids': ','.join(map(str, ids))}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([customer['id'] for customer in response.data['results']], [self.customers[0].id])
+        self.assertEqual(response.data['missing'], ids[1:])
+
+    @override_settings(CUSTOMER_BATCH_GET_MAX_IDS=2)
+    def test_authenticated_user_retrieve_customers_by_invalid_ids_failure(self):
+        """
+        Ensure a user can't retrieve customers by malformed ids or by more ids than allowed
+        """
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        for ids in ['1,abc', '', '1,2,3']:
+            response = self.client.get(self.url, {'ids': ids}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PhotoStorages(APITestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.storages = [InMemoryPhotoStorage(), LocalPhotoStorage(location=self.temp_dir.name)]
+
+    def tearDown(self):
+        InMemoryPhotoStorage.clear()
+        self.temp_dir.cleanup()
+
+    def test_storages_copy_and_delete_photos(self):
+        """
+        Ensure every photo storage copies files, replacing the existing ones, and deletes many files at once
+        """
+
+        for storage in self.storages:
+            with self.subTest(storage=type(storage).__name__):
+                names = [storage.save(f'media/{i}.jpg', ContentFile(f'photo {i}'.encode())) for i in range(3)]
+                storage.copy(names[0], 'archive/media/0.jpg')
+                storage.copy(names[1], 'archive/media/0.jpg')
+                with storage.open('archive/media/0.jpg') as photo:
+                    self.assertEqual(photo.read(), b'photo 1')
+
+                storage.delete_many(names)
+                self.assertFalse(any(storage.exists(name) for name in names))
+                self.assertEqual(storage.listdir('archive/media'), ([], ['0.jpg']))
+                self.assertTrue(storage.presigned_url('archive/media/0.jpg', expire=60).endswith('archive/media/0.jpg'))
+
+
+@override_settings(DEFAULT_FILE_STORAGE='customers.storage.InMemoryPhotoStorage')
+class CustomerPhotoProxy(APITestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        settings_override = override_settings(PHOTO_CACHE_DIR=self.cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.organization = Organization.objects.create(name='my_test_organization')
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+        Profile.objects.create(user=self.normal_user, organization=self.organization)
+        self.application = Application.objects.create(
+            name="Test Application",
+            redirect_uris=("http://localhost"),
+            user=self.normal_user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        self.normal_user_accesstoken = AccessToken.objects.create(
+            user=self.normal_user,
+            token="1234567890",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+
+        self.customer = Customer(
+            name='my_test_name',
+            surname='my_test_surname',
+            created_by=self.normal_user,
+            organization=self.organization
+        )
+        self.customer.photo.save('myimage.jpg', ContentFile(b'0123456789'))
+        self.url = reverse('customers:customer-photo', args=[self.customer.id, self.customer.photo.name])
+
+    def tearDown(self):
+        InMemoryPhotoStorage.clear()
+        self.cache_dir.cleanup()
+
+    def get(self, **headers):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        return self.client.get(self.url, **headers)
+
+    def test_authenticated_user_get_customer_photo(self):
+        """
+        Ensure the photo of a customer is streamed with headers that let clients cache it for good
+        """
+
+        response = self.get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_authenticated_user_get_customer_photo_range(self):
+        """
+        Ensure a range of the photo can be requested, and an unsatisfiable range is rejected
+        """
+
+        for header, content, content_range in [
+            ('bytes=2-5', b'2345', 'bytes 2-5/10'),
+            ('bytes=7-', b'789', 'bytes 7-9/10'),
+            ('bytes=-3', b'789', 'bytes 7-9/10'),
+        ]:
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+            self.assertEqual(b''.join(response.streaming_content), content)
+            self.assertEqual(response['Content-Range'], content_range)
+
+        response = self.get(HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_customer_photo_served_from_cache(self):
+        """
+        Ensure a photo that has been viewed is served from the disk cache without reading it from the storage again
+        """
+
+        response = self.get()
+        b''.join(response.streaming_content)
+
+        with mock.patch.object(InMemoryPhotoStorage, 'iter_chunks') as iter_chunks:
+            response = self.get()
+            self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        iter_chunks.assert_not_called()
+
+    def test_customer_photo_streamed_while_cached(self):
+        """
+        Ensure a photo that isn't cached is sent as it's read from the storage, and only cached once it has been read
+        whole. A range of a photo that isn't cached is read straight from the storage
+        """
+
+        response = self.get(HTTP_RANGE='bytes=2-5')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+
+        with override_settings(PHOTO_CHUNK_SIZE=4):
+            response = self.get()
+        content = iter(response.streaming_content)
+        self.assertEqual(next(content), b'0123')
+        # nothing is cached until the photo has been sent whole
+        self.assertTrue(all(name.endswith('.tmp') for name in os.listdir(self.cache_dir.name)))
+
+        self.assertEqual(b''.join(content), b'456789')
+        self.assertEqual(len(os.listdir(self.cache_dir.name)), 1)
+        self.assertIsNotNone(PhotoCache(self.cache_dir.name, settings.PHOTO_CACHE_MAX_SIZE).get(self.customer.photo.name))
+
+    def test_abandoned_photo_stream_not_cached(self):
+        """
+        Ensure a photo whose stream is closed before it has been read whole (e.g. the client disconnected) isn't cached
+        """
+
+        # the generator is closed directly, closing the response would close the database connection of the test
+        cache = PhotoCache(self.cache_dir.name, settings.PHOTO_CACHE_MAX_SIZE)
+        chunks = cache.tee('abandoned', iter([b'0123', b'4567', b'89']))
+        self.assertEqual(next(chunks), b'0123')
+        self.assertEqual(len(os.listdir(self.cache_dir.name)), 1)
+
+        chunks.close()
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+        self.assertIsNone(cache.get('abandoned'))
+
+    def test_authenticated_user_get_other_customer_photo_failure(self):
+        """
+        Ensure a photo can only be requested through the customer it belongs to
+        """
+
+        other_customer = Customer.objects.create(
+            name='my_test_other_name',
+            surname='my_test_other_surname',
+            created_by=self.normal_user,
+            organization=Organization.objects.create(name='my_test_other_organization')
+        )
+        self.url = reverse('customers:customer-photo', args=[other_customer.id, self.customer.photo.name])
+        response = self.get()
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_photo_cache_evicts_least_recently_viewed(self):
+        """
+        Ensure the disk cache deletes the least recently viewed photos once it's full
+        """
+
+        cache = PhotoCache(self.cache_dir.name, max_size=25)
+        for i, key in enumerate(['first', 'second']):
+            path = cache.put(key, [b'0123456789'])
+            os.utime(path, (i, i))
+        cache.get('first')
+        cache.put('third', [b'0123456789'])
+
+        self.assertIsNotNone(cache.get('first'))
+        self.assertIsNone(cache.get('second'))
+        self.assertIsNotNone(cache.get('third'))
+
+
+@override_settings(DEFAULT_FILE_STORAGE='customers.storage.InMemoryPhotoStorage')
+class CustomerIdempotencyKeys(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('customers:customers-list')
+
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+        self.application = Application.objects.create(
+            name="Test Application",
+            redirect_uris=("http://localhost"),
+            user=self.normal_user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        self.normal_user_accesstoken = AccessToken.objects.create(
+            user=self.normal_user,
+            token="1234567890",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+
+    def tearDown(self):
+        InMemoryPhotoStorage.clear()
+
+    def test_retried_create_customer_replayed(self):
+        """
+        Ensure a retried customer creation gets the response of the first request without creating the customer again
+        """
+
+        data = {'name': 'my_new_name', 'surname': 'my_new_surname'}
+        response = self.client.post(self.url, data, format='json', HTTP_IDEMPOTENCY_KEY='my_key')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        retry = self.client.post(self.url, data, format='json', HTTP_IDEMPOTENCY_KEY='my_key')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, response.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Customer.objects.count(), 1)
+
+        # another key is another request
+        response = self.client.post(self.url, data, format='json', HTTP_IDEMPOTENCY_KEY='my_other_key')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Customer.objects.count(), 2)
+
+    def test_retried_photo_update_replayed(self):
+        """
+        Ensure a retried photo upload doesn't upload the photo again, even if its multipart body is encoded differently
+        """
+
+        customer = Customer.objects.create(name='my_test_name', surname='my_test_surname', created_by=self.normal_user)
+        url = reverse('customers:customer-detail', args=[customer.id])
+
+        responses = []
+        for boundary in ('first_boundary', 'second_boundary'):
+            img = BytesIO(b'mybinarydata')
+            img.name = 'myimage.jpg'
+            responses.append(self.client.patch(
+                url,
+                encode_multipart(boundary, {'photo': img}),
+                content_type=f'multipart/form-data; boundary={boundary}',
+                HTTP_IDEMPOTENCY_KEY='my_key'
+            ))
+
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_200_OK] * 2)
+        self.assertEqual(responses[1].data, responses[0].data)
+        self.assertEqual(responses[1]['ETag'], responses[0]['ETag'])
+        self.assertEqual(len(InMemoryPhotoStorage.files), 1)
+        self.assertEqual(Customer.objects.get(id=customer.id).version, customer.version + 1)
+
+    def test_conflicting_update_not_replayed(self):
+        """
+        Ensure an update rejected because the customer was changed concurrently isn't stored, so its retry is run again
+        """
+
+        customer = Customer.objects.create(name='my_test_name', surname='my_test_surname', created_by=self.normal_user)
+        url = reverse('customers:customer-detail', args=[customer.id])
+        get_object = CustomerDetail.get_object
+
+        def get_object_changed_concurrently(view):
+            customer = get_object(view)
+            Customer.objects.filter(id=customer.id).update(version=F('version') + 1)
+            return customer
+
+        with mock.patch.object(CustomerDetail, 'get_object', autospec=True, side_effect=get_object_changed_concurrently):
+            response = self.client.patch(url, {'name': 'my_new_name'}, format='json', HTTP_IDEMPOTENCY_KEY='my_key')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        retry = self.client.patch(url, {'name': 'my_new_name'}, format='json', HTTP_IDEMPOTENCY_KEY='my_key')
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Idempotent-Replayed', retry)
+        self.assertEqual(Customer.objects.get(id=customer.id).name, 'my_new_name')
+
+    def test_reused_idempotency_key_failure(self):
+        """
+        Ensure an idempotency key can't be reused for a different request
+        """
+
+        response = self.client.post(self.url, {'name': 'my_new_name', 'surname': 'my_new_surname'}, format='json', HTTP_IDEMPOTENCY_KEY='my_key')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.post(self.url, {'name': 'my_other_name', 'surname': 'my_new_surname'}, format='json', HTTP_IDEMPOTENCY_KEY='my_key')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Customer.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=1)
+    def test_retry_waits_for_request_in_progress(self):
+        """
+        Ensure a retry that arrives while the first request is being handled waits for its response
+        """
+
+        data = {'name': 'my_new_name', 'surname': 'my_new_surname'}
+        response = self.client.post(self.url, data, format='json', HTTP_IDEMPOTENCY_KEY='my_key')
+        idempotency_key = IdempotencyKey.objects.get()
+        stored_response = idempotency_key.status_code, idempotency_key.response
+        IdempotencyKey.objects.update(status_code=None, response='')
+
+        def finish_request(seconds):
+            IdempotencyKey.objects.update(status_code=stored_response[0], response=stored_response[1])
+
+        with mock.patch('customers.idempotency.time.sleep', side_effect=finish_request) as sleep:
+            retry = self.client.post(self.url, data, format='json', HTTP_IDEMPOTENCY_KEY='my_key')
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, response.data)
+        self.assertEqual(Customer.objects.count(), 1)
+
+        # a request that is never finished makes the retries give up
+        IdempotencyKey.objects.update(status_code=None, response='')
+        with override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0):
+            retry = self.client.post(self.url, data, format='json', HTTP_IDEMPOTENCY_KEY='my_key')
+        self.assertEqual(retry.status_code, status.HTTP_409_CONFLICT)
+
+    def test_purge_expired_idempotency_keys(self):
+        """
+        Ensure the expired idempotency keys are purged, and can be used again
+        """
+
+        data = {'name': 'my_new_name', 'surname': 'my_new_surname'}
+        self.client.post(self.url, data, format='json', HTTP_IDEMPOTENCY_KEY='my_key')
+        self.client.post(self.url, data, format='json', HTTP_IDEMPOTENCY_KEY='my_other_key')
+        IdempotencyKey.objects.filter(key='my_key').update(expires_at=timezone.now())
+
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('Deleted 1 idempotency keys', out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['my_other_key'])
+
+        response = self.client.post(self.url, data, format='json', HTTP_IDEMPOTENCY_KEY='my_key')
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Customer.objects.count(), 3)
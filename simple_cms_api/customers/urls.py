@@ -5,5 +5,13 @@ app_name = 'customers'
 
 urlpatterns = [
     path('', views.CustomerList.as_view(), name='customers-list'),
+    path('/deactivate', views.CustomerDeactivate.as_view(), name='customers-deactivate'),
+    path('/imports', views.ImportJobList.as_view(), name='import-list'),
+    path('/imports/<pk>', views.ImportJobDetail.as_view(), name='import-detail'),
+    path('/imports/<pk>/errors', views.ImportJobErrorList.as_view(), name='import-error-list'),
+    path('/archive', views.ArchivedCustomerList.as_view(), name='archived-customer-list'),
+    path('/archive/<pk>/restore', views.ArchivedCustomerRestore.as_view(), name='archived-customer-restore'),
     path('/<pk>', views.CustomerDetail.as_view(), name='customer-detail'),
+    path('/<pk>/history', views.CustomerHistoryList.as_view(), name='customer-history'),
+    path('/<pk>/photo/<path:key>', views.CustomerPhoto.as_view(), name='customer-photo'),
 ]
\ No newline at end of file
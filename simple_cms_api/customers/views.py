@@ -1,21 +1,349 @@
-from .serializers import CustomerSerializer
-from rest_framework import generics
+import mimetypes
+import os
+import posixpath
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
+from .exceptions import PreconditionFailed
+from .idempotency import IdempotentMixin
+from .archive import restore_customer
+from .deactivation import deactivate_customers
+from .serializers import (
+    ArchivedCustomerSerializer, CustomerDeactivationSerializer, CustomerHistorySerializer, CustomerSerializer, CustomerValuesSerializer, ImportJobSerializer, ImportJobErrorSerializer
+)
+from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from oauth2_provider.contrib.rest_framework import TokenHasReadWriteScope
-from .models import Customer
+from users.models import get_organization_id
+from .models import ArchivedCustomer, Customer, CustomerHistory, ImportJob, ImportJobError
+from .photos import PhotoCache, RangeNotSatisfiable, parse_range
+from .storage import read_chunks
+from .pagination import ArchivedCustomerPagination, CustomerHistoryPagination, CustomerKeysetPagination, ImportJobPagination
 
 
-class CustomerList(generics.ListCreateAPIView):
+class CustomerList(IdempotentMixin, generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
-    queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
+    pagination_class = CustomerKeysetPagination
 
+    def get_queryset(self):
+        return Customer.objects.for_organization(get_organization_id(self.request.user))
 
-class CustomerDetail(generics.RetrieveUpdateDestroyAPIView):
+    def create(self, request, *args, **kwargs):
+        return self.idempotent(super().create, request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        if 'ids' in request.query_params:
+            return self.list_by_ids(request.query_params['ids'])
+
+        # listings are read-only, so they skip the ModelSerializer machinery and are built from the raw rows
+        rows = CustomerValuesSerializer.values(self.filter_queryset(self.get_queryset()), 'sort_key')
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            serializer = CustomerValuesSerializer(page, context=self.get_serializer_context())
+            return self.get_paginated_response(serializer.data)
+
+        serializer = CustomerValuesSerializer(rows, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    def list_by_ids(self, ids):
+        """
+        Customers with the given ids (up to CUSTOMER_BATCH_GET_MAX_IDS) in the order they were requested, read with a
+        single query. The ids of the customers that don't exist (or were deleted) are listed as missing.
+        """
+        ids = parse_ids(ids)
+        rows = CustomerValuesSerializer.values(self.get_queryset().filter(pk__in=ids))
+        rows_by_id = {row.id: row for row in rows}
+
+        serializer = CustomerValuesSerializer(
+            [rows_by_id[pk] for pk in ids if pk in rows_by_id],
+            context=self.get_serializer_context()
+        )
+        return Response({
+            'results': serializer.data,
+            'missing': [pk for pk in ids if pk not in rows_by_id],
+        })
+
+
+class CustomerDetail(IdempotentMixin, generics.RetrieveUpdateDestroyAPIView):
+    permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
+    serializer_class = CustomerSerializer
+
+    def get_queryset(self):
+        return Customer.objects.for_organization(get_organization_id(self.request.user))
+
+    def get_object(self):
+        instance = super().get_object()
+        if self.request.method in ('PUT', 'PATCH'):
+            self.check_version_precondition(instance)
+        return instance
+
+    def check_version_precondition(self, instance):
+        """
+        If the request has an If-Match header, it must match the ETag of the customer's current version
+        """
+        versions = self.if_match_versions()
+        if versions is not None and instance.version not in versions:
+            raise PreconditionFailed()
+
+    def if_match_versions(self):
+        """
+        Versions of the customer accepted by the If-Match header, or None if any version is. Raises PreconditionFailed
+        if the header has none of our ETags, as no version can match it
+        """
+        if_match = self.request.META.get('HTTP_IF_MATCH')
+        if if_match is None:
+            return None
+
+        etags = parse_etags(if_match)
+        if '*' in etags:
+            return None
+        # the ETags of compressed responses are weak (W/"3"), but they still stand for the same version
+        versions = [etag[2:] if etag.startswith('W/') else etag for etag in etags]
+        versions = [int(version.strip('"')) for version in versions if version.strip('"').isdigit()]
+        if not versions:
+            raise PreconditionFailed()
+        return versions
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        response['ETag'] = version_etag(response.data['version'])
+        return response
+
+    def update(self, request, *args, **kwargs):
+        return self.idempotent(self.update_customer, request, *args, **kwargs)
+
+    def update_customer(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        response['ETag'] = version_etag(response.data['version'])
+        return response
+
+    def destroy(self, request, *args, **kwargs):
+        # deactivated with a single UPDATE, without reading the customer first
+        try:
+            customers = self.get_queryset().filter(pk=kwargs['pk'])
+        except (TypeError, ValueError):
+            raise Http404()
+        versions = self.if_match_versions()
+        if versions is not None:
+            customers = customers.filter(version__in=versions)
+
+        if not deactivate_customers(customers, request.user):
+            if versions is not None and self.get_queryset().filter(pk=kwargs['pk']).exists():
+                raise PreconditionFailed()
+            raise Http404()
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CustomerDeactivate(generics.GenericAPIView):
+    """
+    Deactivates all the customers of the organization that match the filters in the body of the request
+    """
+    permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
+    serializer_class = CustomerDeactivationSerializer
+    throttle_scope = 'bulk'
+
+    def get_queryset(self):
+        return Customer.objects.for_organization(get_organization_id(self.request.user))
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        customers = self.get_queryset()
+        if 'ids' in serializer.validated_data:
+            customers = customers.filter(pk__in=serializer.validated_data['ids'])
+        if 'created_by' in serializer.validated_data:
+            customers = customers.filter(created_by_id=serializer.validated_data['created_by'])
+
+        return Response({'deactivated': deactivate_customers(customers, request.user)})
+
+
+class CustomerHistoryList(generics.ListAPIView):
+    permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
+    serializer_class = CustomerHistorySerializer
+    pagination_class = CustomerHistoryPagination
+
+    def get_queryset(self):
+        # the history of deleted (but not yet archived) customers can still be read
+        customers = Customer.all_objects.for_organization(get_organization_id(self.request.user))
+        customer = get_object_or_404(customers, pk=self.kwargs['pk'])
+        return CustomerHistory.objects.filter(customer_id=customer.pk)
+
+
+class CustomerPhoto(generics.GenericAPIView):
+    """
+    Serves the photo of a customer by its key, streaming it from the storage through a local disk cache (see
+    PhotoCache). The keys are unique per upload, so the responses can be cached by the clients for good.
+    """
+    permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
+    cache_control = 'private, max-age=31536000, immutable, no-transform'
+
+    def get_queryset(self):
+        return Customer.objects.for_organization(get_organization_id(self.request.user))
+
+    def get(self, request, pk, key):
+        try:
+            exists = self.get_queryset().filter(pk=pk, photo=key).exists()
+        except (TypeError, ValueError):
+            exists = False
+        if not exists:
+            raise Http404
+
+        etag = f'"{posixpath.basename(key)}"'
+        if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+            return self.photo_headers(HttpResponseNotModified(), etag)
+
+        size, stream, close = self.open_photo(key)
+
+        byte_range = None
+        if request.META.get('HTTP_IF_RANGE', etag) == etag:
+            try:
+                byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+            except RangeNotSatisfiable:
+                close()
+                response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response['Content-Range'] = f'bytes */{size}'
+                return self.photo_headers(response, etag)
+
+        start, end = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(
+            stream(start, end),
+            status=status.HTTP_200_OK if byte_range is None else status.HTTP_206_PARTIAL_CONTENT,
+            content_type=mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        )
+        response['Content-Length'] = str(end - start + 1)
+        if byte_range is not None:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        return self.photo_headers(response, etag)
+
+    def open_photo(self, key):
+        """
+        Returns the size of the photo, a function that streams the bytes from start to end of it and a function that
+        closes the photo if it isn't streamed.
+
+        A photo that isn't cached is streamed from the storage as it's read, and cached along the way if the whole
+        photo is requested. The ranges of photos that aren't cached are streamed straight from the storage
+        """
+        storage = Customer._meta.get_field('photo').storage
+        chunk_size = settings.PHOTO_CHUNK_SIZE
+        cache = PhotoCache(settings.PHOTO_CACHE_DIR, settings.PHOTO_CACHE_MAX_SIZE)
+        file = cache.open(key) if cache.max_size else None
+        if file is None:
+            size = storage.size(key)
+
+            def stream(start, end):
+                if cache.max_size and (start, end) == (0, size - 1):
+                    yield from cache.tee(key, storage.iter_chunks(key, chunk_size=chunk_size))
+                else:
+                    yield from storage.iter_chunks(key, start, end, chunk_size)
+
+            return size, stream, lambda: None
+
+        def stream(start, end):
+            with file:
+                yield from read_chunks(file, start, end, chunk_size)
+
+        return os.fstat(file.fileno()).st_size, stream, file.close
+
+    def photo_headers(self, response, etag):
+        response['ETag'] = etag
+        response['Cache-Control'] = self.cache_control
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+
+class ImportJobList(generics.ListCreateAPIView):
+    permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
+    serializer_class = ImportJobSerializer
+    pagination_class = ImportJobPagination
+    throttle_scope = 'bulk'
+    throttle_methods = ('POST',)
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(created_by=self.request.user).order_by('-created_at')
+
+
+class ImportJobDetail(generics.RetrieveAPIView):
+    permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
+    serializer_class = ImportJobSerializer
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(created_by=self.request.user)
+
+
+class ImportJobErrorList(generics.ListAPIView):
+    permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
+    serializer_class = ImportJobErrorSerializer
+    pagination_class = ImportJobPagination
+
+    def get_queryset(self):
+        return ImportJobError.objects.filter(
+            job_id=self.kwargs['pk'],
+            job__created_by=self.request.user
+        ).order_by('row')
+
+
+class ArchivedCustomerList(generics.ListAPIView):
+    permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
+    serializer_class = ArchivedCustomerSerializer
+    pagination_class = ArchivedCustomerPagination
+
+    def get_queryset(self):
+        return ArchivedCustomer.objects.filter(organization_id=get_organization_id(self.request.user)).order_by('id')
+
+
+class ArchivedCustomerRestore(generics.GenericAPIView):
     permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
-    queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
 
-    def perform_destroy(self, instance):
-        instance.is_active = False
-        instance.save(update_fields=['is_active'])
\ No newline at end of file
+    def get_queryset(self):
+        return ArchivedCustomer.objects.filter(organization_id=get_organization_id(self.request.user))
+
+    def post(self, request, *args, **kwargs):
+        archived_customer = get_object_or_404(self.get_queryset(), pk=kwargs['pk'])
+        try:
+            customer = restore_customer(archived_customer, request.user)
+        except ArchivedCustomer.DoesNotExist:
+            raise Http404()
+
+        serializer = self.get_serializer(customer)
+        response = Response(serializer.data, status=status.HTTP_201_CREATED)
+        response['ETag'] = version_etag(customer.version)
+        return response
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Whether the If-None-Match header matches the ETag, with the weak comparison (compressed responses have weak ETags)
+    """
+    if not if_none_match:
+        return False
+
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags or f'W/{etag}' in etags
+
+
+def parse_ids(value):
+    """
+    Unique ids of a comma separated list, in order
+    """
+    try:
+        ids = list(dict.fromkeys(int(pk) for pk in value.split(',') if pk.strip()))
+    except ValueError:
+        raise ValidationError({'ids': 'Expected a comma separated list of customer ids.'})
+
+    if not ids:
+        raise ValidationError({'ids': 'Expected at least one customer id.'})
+    if len(ids) > settings.CUSTOMER_BATCH_GET_MAX_IDS:
+        raise ValidationError({'ids': f'Expected at most {settings.CUSTOMER_BATCH_GET_MAX_IDS} customer ids.'})
+    return ids
+
+
+def version_etag(version):
+    return f'"{version}"'
\ No newline at end of file
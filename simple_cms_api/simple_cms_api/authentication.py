@@ -0,0 +1,19 @@
+from oauth2_provider.contrib.rest_framework import authentication
+
+
+class OAuth2Authentication(authentication.OAuth2Authentication):
+    """
+    OAuth2Authentication that reuses the token validated by BearerTokenMiddleware, so the token of a request is only
+    validated once. Falls back to validating it when the middleware didn't.
+    """
+
+    def authenticate(self, request):
+        result = getattr(request._request, 'oauth2_result', None)
+        if result is None:
+            return super().authenticate(request)
+
+        valid, oauthlib_request = result
+        if valid:
+            return oauthlib_request.user, oauthlib_request.access_token
+        request.oauth2_error = getattr(oauthlib_request, 'oauth2_error', {})
+        return None
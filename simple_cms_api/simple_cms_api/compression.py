@@ -0,0 +1,123 @@
+import zlib
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, responses are compressed with the other encodings
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, responses are compressed with the other encodings
+    zstandard = None
+
+
+class GzipEncoder:
+    encoding = 'gzip'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def compress_stream(self, chunks):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            # every chunk is flushed, so the client gets it as soon as it's produced
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class BrotliEncoder:
+    encoding = 'br'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level)
+
+    def compress_stream(self, chunks):
+        compressor = brotli.Compressor(quality=self.level)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class ZstdEncoder:
+    encoding = 'zstd'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def compress_stream(self, chunks):
+        compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+ENCODER_CLASSES = {
+    'gzip': GzipEncoder,
+    'br': BrotliEncoder if brotli is not None else None,
+    'zstd': ZstdEncoder if zstandard is not None else None,
+}
+
+
+def available_encoders():
+    """
+    Encoders of the COMPRESSION_ENCODINGS whose libraries are installed, in order of preference
+    """
+    return [
+        ENCODER_CLASSES[encoding](settings.COMPRESSION_LEVELS[encoding])
+        for encoding in settings.COMPRESSION_ENCODINGS
+        if ENCODER_CLASSES.get(encoding) is not None
+    ]
+
+
+def parse_accept_encoding(header):
+    """
+    {encoding: quality} of an Accept-Encoding header
+    """
+    qualities = {}
+    for item in header.split(','):
+        encoding, _, params = item.strip().partition(';')
+        encoding = encoding.strip().lower()
+        if not encoding:
+            continue
+
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[encoding] = quality
+    return qualities
+
+
+def negotiate_encoder(header, encoders):
+    """
+    The encoder the client prefers (with the highest quality) out of the available ones, ties are broken by the order
+    of the encoders. None if the client accepts none of them.
+    """
+    qualities = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for encoder in encoders:
+        quality = qualities.get(encoder.encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoder, quality
+    return best
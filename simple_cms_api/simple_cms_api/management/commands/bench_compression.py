@@ -0,0 +1,43 @@
+import timeit
+from django.core.management.base import BaseCommand
+from simple_cms_api.compression import ENCODER_CLASSES
+from simple_cms_api.renderers import FastJSONRenderer
+from .bench_json import customer_rows, user_rows
+
+LEVELS = {
+    'gzip': [1, 6, 9],
+    'br': [1, 4, 11],
+    'zstd': [1, 3, 19],
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the CPU time and bytes saved by every response encoding and level with customer and user pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        missing = [encoding for encoding, encoder_class in ENCODER_CLASSES.items() if encoder_class is None]
+        if missing:
+            self.stderr.write(f'Skipping {", ".join(missing)}: install the brotli and zstandard packages to benchmark them')
+
+        renderer = FastJSONRenderer()
+        for payload_name, build_rows in [('customers', customer_rows), ('users', user_rows)]:
+            for num_rows in options['rows']:
+                body = renderer.render(build_rows(num_rows), 'application/json')
+                self.stdout.write(f'{payload_name} x {num_rows}: {len(body):,} bytes')
+
+                for encoding, encoder_class in ENCODER_CLASSES.items():
+                    if encoder_class is None:
+                        continue
+                    for level in LEVELS[encoding]:
+                        encoder = encoder_class(level)
+                        compressed = encoder.compress(body)
+                        best = min(timeit.repeat(lambda: encoder.compress(body), number=1, repeat=options['repeat']))
+                        self.stdout.write(
+                            f'    {encoding:>4}-{level:<2} {len(compressed):>9,} bytes '
+                            f'({100 - len(compressed) * 100 / len(body):4.1f}% saved) in {best * 1000:7.3f}ms '
+                            f'({len(body) / best / 1e6:,.0f} MB/s)'
+                        )
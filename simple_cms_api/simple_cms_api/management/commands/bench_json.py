@@ -0,0 +1,73 @@
+import timeit
+from collections import OrderedDict
+from datetime import timedelta
+from uuid import uuid4
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnList
+from simple_cms_api.renderers import FastJSONRenderer, orjson
+
+
+def customer_rows(num_rows):
+    """
+    Rows shaped like the output of CustomerSerializer
+    """
+    return ReturnList([
+        OrderedDict([
+            ('id', i),
+            ('name', f'name {i}'),
+            ('surname', f'súrname {i}'),
+            ('photo', f'https://bucket.s3.amazonaws.com/{settings.MEDIA_URL}/{uuid4().hex}.jpg' if i % 2 else None),
+            ('created_by', i % 50),
+            ('updated_by', i % 50 if i % 3 else None),
+        ])
+        for i in range(num_rows)
+    ], serializer=None)
+
+
+def user_rows(num_rows):
+    """
+    Rows shaped like the output of UserSerializer, datetimes are left for the renderer to encode
+    """
+    now = timezone.now()
+    return ReturnList([
+        OrderedDict([
+            ('id', i),
+            ('is_staff', i % 10 == 0),
+            ('username', f'user{i}'),
+            ('email', f'user{i}@example.com'),
+            ('first_name', 'first'),
+            ('last_name', 'last'),
+            ('last_login', now - timedelta(minutes=i) if i % 2 else None),
+            ('date_joined', now - timedelta(days=i)),
+        ])
+        for i in range(num_rows)
+    ], serializer=None)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the stdlib and the orjson backed JSON renderers with customer and user listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write('orjson is not installed, FastJSONRenderer will fall back to the stdlib json module')
+
+        renderers = [('stdlib', JSONRenderer()), ('orjson', FastJSONRenderer())]
+        for payload_name, build_rows in [('customers', customer_rows), ('users', user_rows)]:
+            for num_rows in options['rows']:
+                data = build_rows(num_rows)
+                outputs = set()
+                timings = []
+                for renderer_name, renderer in renderers:
+                    outputs.add(renderer.render(data, 'application/json'))
+                    best = min(timeit.repeat(lambda: renderer.render(data, 'application/json'), number=1, repeat=options['repeat']))
+                    timings.append(f'{renderer_name}={best * 1000:.2f}ms')
+
+                identical = 'identical' if len(outputs) == 1 else 'DIFFERENT'
+                self.stdout.write(f'{payload_name} x {num_rows}: {" ".join(timings)} (output {identical})')
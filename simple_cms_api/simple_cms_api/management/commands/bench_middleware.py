@@ -0,0 +1,100 @@
+import statistics
+import time
+from datetime import timedelta
+from uuid import uuid4
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model, get_application_model
+from customers.models import Customer
+
+# the middleware before bearer token API requests had a fast path: the token was validated by OAuth2TokenMiddleware
+# and then again by DRF's authentication
+FULL_MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'oauth2_provider.middleware.OAuth2TokenMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the time and queries per request of GET /customers/<pk> with a bearer token (and a session ' \
+           'cookie) through the full middleware stack and through the current one. Everything is done inside a ' \
+           'transaction that is rolled back at the end.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['requests'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def run(self, num_requests):
+        user = get_user_model().objects.create(username=f'bench_{uuid4().hex}')
+        application = get_application_model().objects.create(
+            name='bench',
+            user=user,
+            client_type='confidential',
+            authorization_grant_type='authorization-code'
+        )
+        token = get_access_token_model().objects.create(
+            user=user,
+            token=uuid4().hex,
+            application=application,
+            expires=timezone.now() + timedelta(days=1),
+            scope='read write'
+        )
+        customer = Customer.objects.create(name='name', surname='surname', created_by=user)
+        # browsers that also use the admin panel send their session cookie along
+        session = SessionStore()
+        session.create()
+
+        stacks = [
+            ('full middleware', ['simple_cms_api.middleware.ConcurrencyLimitMiddleware', *FULL_MIDDLEWARE]),
+            ('bearer fast path', settings.MIDDLEWARE),
+        ]
+        # throttling is left out, it would reject most of the requests
+        rest_framework = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'client': None, 'uploads': None, 'bulk': None}}
+        for name, middleware in stacks:
+            with override_settings(MIDDLEWARE=middleware, REST_FRAMEWORK=rest_framework, ALLOWED_HOSTS=['testserver']):
+                client = Client(HTTP_AUTHORIZATION=f'Bearer {token.token}')
+                client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+                url = f'/customers/{customer.pk}'
+
+                # the query log is reset on every request, so the queries are counted as they are executed
+                queries = []
+
+                def count_query(execute, sql, params, many, context):
+                    queries.append(sql)
+                    return execute(sql, params, many, context)
+
+                with connection.execute_wrapper(count_query):
+                    response = client.get(url)
+                assert response.status_code == 200, response.content
+
+                timings = []
+                for _ in range(num_requests):
+                    start = time.perf_counter()
+                    client.get(url)
+                    timings.append(time.perf_counter() - start)
+
+            self.stdout.write(f'{name}: mean={statistics.mean(timings) * 1e6:.0f}us '
+                              f'p50={statistics.median(timings) * 1e6:.0f}us queries/request={len(queries)}')
@@ -0,0 +1,79 @@
+import json
+import os
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# modules that are slow to import, reported when a process imports them at startup
+HEAVY_MODULES = ['boto3', 'botocore', 'storages.backends.s3boto3', 'urllib3', 'django.contrib.admin', 'django.template']
+
+# run by a new python process: starts Django as the WSGI server does and loads the URLconf (which imports every
+# view) as the first request would, then reports what that cost
+STARTUP_SCRIPT = f'''
+import json, resource, sys, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({{
+    'seconds': time.perf_counter() - start,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': len(sys.modules),
+    'heavy_modules': [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measure the startup time, peak memory (RSS) and slowest imports of a new Django process with each ' \
+           'settings module, to track the startup cost of every release.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--settings-modules', nargs='+',
+                            default=['simple_cms_api.settings', 'simple_cms_api.settings_api'])
+        parser.add_argument('--repeat', type=int, default=5, help='processes started per settings module')
+        parser.add_argument('--top', type=int, default=10, help='slowest top-level imports reported')
+
+    def handle(self, *args, **options):
+        for settings_module in options['settings_modules']:
+            runs = [self.start_process(settings_module) for _ in range(options['repeat'])]
+            best = min(runs, key=lambda run: run['seconds'])
+            heavy_modules = ', '.join(best['heavy_modules']) or 'none'
+            self.stdout.write(
+                f'{settings_module}: startup={best["seconds"] * 1000:.0f}ms '
+                f'rss={max(run["max_rss_kb"] for run in runs) / 1024:.1f}MB modules={best["modules"]} '
+                f'heavy modules imported: {heavy_modules}'
+            )
+
+            if options['top']:
+                for cumulative, name in self.slowest_imports(settings_module)[:options['top']]:
+                    self.stdout.write(f'    {cumulative / 1000:8.1f}ms  {name}')
+
+    def run_python(self, settings_module, *python_options):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module}
+        result = subprocess.run(
+            [sys.executable, *python_options, '-c', STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode:
+            raise CommandError(f'{settings_module} failed to start:\n{result.stderr}')
+        return result
+
+    def start_process(self, settings_module):
+        return json.loads(self.run_python(settings_module).stdout.splitlines()[-1])
+
+    def slowest_imports(self, settings_module):
+        """
+        (cumulative microseconds, module) of the top-level imports, slowest first, from python's -X importtime
+        """
+        imports = []
+        for line in self.run_python(settings_module, '-X', 'importtime').stderr.splitlines():
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            # nested imports are indented under the module that imported them
+            if cumulative.strip().isdigit() and not name[1:].startswith(' '):
+                imports.append((int(cumulative), name.strip()))
+        return sorted(imports, reverse=True)
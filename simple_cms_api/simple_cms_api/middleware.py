@@ -0,0 +1,186 @@
+import re
+import threading
+from django.conf import settings
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.messages import middleware as messages_middleware
+from django.contrib.sessions import middleware as sessions_middleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from django.middleware import clickjacking, csrf
+from django.utils.cache import patch_vary_headers
+from .compression import available_encoders, negotiate_encoder
+from .profiling import sampler
+from oauth2_provider.oauth2_backends import get_oauthlib_core
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Sheds requests with a 503 as soon as MAX_CONCURRENT_REQUESTS requests are already being handled by this process,
+    instead of letting them queue up behind the busy ones. Disabled when MAX_CONCURRENT_REQUESTS is 0.
+    """
+
+    def __init__(self, get_response):
+        if not settings.MAX_CONCURRENT_REQUESTS:
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+        self.semaphore = threading.BoundedSemaphore(settings.MAX_CONCURRENT_REQUESTS)
+
+    def __call__(self, request):
+        if not self.semaphore.acquire(blocking=False):
+            response = JsonResponse({'detail': 'The server is overloaded, try again later.'}, status=503)
+            response['Retry-After'] = str(settings.CONCURRENCY_LIMIT_RETRY_AFTER)
+            return response
+
+        try:
+            return self.get_response(request)
+        finally:
+            self.semaphore.release()
+
+
+class ProfilingMiddleware:
+    """
+    Lets the profiler (see simple_cms_api.profiling) sample the stacks of the requests it picks while it's running.
+    When it isn't, the only overhead is checking a flag, so the middleware can stay enabled in production.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not sampler.active or not sampler.should_profile():
+            return self.get_response(request)
+
+        thread_id = threading.get_ident()
+        sampler.track(thread_id)
+        try:
+            return self.get_response(request)
+        finally:
+            sampler.untrack(thread_id)
+
+
+class CompressionMiddleware:
+    """
+    Compresses the responses with the encoding the client prefers out of COMPRESSION_ENCODINGS (zstd, brotli and gzip,
+    if their libraries are installed), at the level set in COMPRESSION_LEVELS.
+
+    Responses smaller than COMPRESSION_MIN_SIZE aren't compressed, as it doesn't pay off. Streaming responses are
+    compressed chunk by chunk as they are sent.
+    """
+    strong_etag = re.compile(r'^\s*"')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.encoders = available_encoders()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if response.has_header('Content-Encoding') or response.status_code in (206, 304):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        if 'no-transform' in response.get('Cache-Control', ''):
+            return response
+
+        # the response depends on the Accept-Encoding header even if it isn't compressed for this client
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoder = negotiate_encoder(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.encoders)
+        if encoder is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = encoder.compress_stream(response.streaming_content)
+            del response['Content-Length']
+        else:
+            compressed = encoder.compress(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # the compressed body is not byte for byte the same representation anymore, so its ETag can only be weak
+        etag = response.get('ETag')
+        if etag and self.strong_etag.match(etag):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoder.encoding
+        return response
+
+
+def has_bearer_token(request):
+    return request.META.get('HTTP_AUTHORIZATION', '').startswith('Bearer ')
+
+
+def is_bearer_api_request(request):
+    """
+    Requests to the API (the BEARER_API_PATH_PREFIXES paths) authenticated with a bearer token, which don't use
+    sessions, CSRF protection, messages or frame options
+    """
+    return has_bearer_token(request) and request.path_info.startswith(tuple(settings.BEARER_API_PATH_PREFIXES))
+
+
+class BearerTokenMiddleware:
+    """
+    Validates the bearer token of the request, if it has one, and sets request.user to its user.
+
+    The result is kept in request.oauth2_result, so the API views authenticate the request with it (see
+    simple_cms_api.authentication) instead of validating the token again. Only the Authorization header is read, the
+    body of the request is left for the views to parse.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.oauthlib_core = get_oauthlib_core()
+
+    def __call__(self, request):
+        if has_bearer_token(request):
+            core = self.oauthlib_core
+            request.oauth2_result = core.server.verify_request(
+                core._get_escaped_full_path(request),
+                request.method,
+                None,
+                core.extract_headers(request),
+                scopes=[]
+            )
+            valid, oauthlib_request = request.oauth2_result
+            if valid:
+                request.user = request._cached_user = oauthlib_request.user
+
+        response = self.get_response(request)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+class SkipForBearerAPIRequestsMixin:
+    """
+    Runs the middleware for every request except the bearer token API requests
+    """
+
+    def __call__(self, request):
+        if is_bearer_api_request(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class SessionMiddleware(SkipForBearerAPIRequestsMixin, sessions_middleware.SessionMiddleware):
+    pass
+
+
+class CsrfViewMiddleware(SkipForBearerAPIRequestsMixin, csrf.CsrfViewMiddleware):
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        if is_bearer_api_request(request):
+            return None
+        return super().process_view(request, callback, callback_args, callback_kwargs)
+
+
+class AuthenticationMiddleware(SkipForBearerAPIRequestsMixin, auth_middleware.AuthenticationMiddleware):
+    pass
+
+
+class MessageMiddleware(SkipForBearerAPIRequestsMixin, messages_middleware.MessageMiddleware):
+    pass
+
+
+class XFrameOptionsMiddleware(SkipForBearerAPIRequestsMixin, clickjacking.XFrameOptionsMiddleware):
+    pass
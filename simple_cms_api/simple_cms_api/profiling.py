@@ -0,0 +1,126 @@
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def folded_stack(frame):
+    """
+    Stack of the frame, from the outermost call to the innermost one, in the folded format of flamegraph.pl
+    (`module:function;module:function`)
+    """
+    calls = []
+    while frame is not None:
+        calls.append(f'{frame.f_globals.get("__name__", "?")}:{frame.f_code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(calls))
+
+
+class Sampler:
+    """
+    Statistical profiler for the requests handled by this process.
+
+    While it's running, a background thread takes the stacks of the threads handling profiled requests every
+    `interval` seconds (with sys._current_frames, so the requests themselves aren't slowed down) and counts how many
+    times every stack was seen. It stops by itself once `duration` seconds have passed.
+
+    When it isn't running, ProfilingMiddleware only checks the `active` flag.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = False
+        self.thread = None
+        self.thread_ids = set()
+        self.stacks = Counter()
+        self.samples = 0
+        self.sample_rate = 1.0
+        self.interval = 0.01
+        self.started_at = None
+        self.ends_at = None
+
+    def start(self, duration, sample_rate=1.0, interval=0.01):
+        with self.lock:
+            self.stacks.clear()
+            self.samples = 0
+            self.sample_rate = sample_rate
+            self.interval = interval
+            self.started_at = time.time()
+            self.ends_at = time.monotonic() + duration
+            self.active = True
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='profiler', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.active = False
+
+    def should_profile(self):
+        """
+        Whether the request that is starting has to be profiled: only a `sample_rate` fraction of them is
+        """
+        if time.monotonic() >= self.ends_at:
+            self.active = False
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def track(self, thread_id):
+        with self.lock:
+            self.thread_ids.add(thread_id)
+
+    def untrack(self, thread_id):
+        with self.lock:
+            self.thread_ids.discard(thread_id)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if not self.active or time.monotonic() >= self.ends_at:
+                    self.active = False
+                    self.thread = None
+                    return
+            self.sample()
+
+    def sample(self):
+        """
+        Counts the current stack of every profiled thread. The lock is only held to copy the profiled threads and to
+        add up the counts, not while the stacks are walked, so the requests that start or end meanwhile aren't blocked
+        """
+        with self.lock:
+            thread_ids = list(self.thread_ids)
+            started_at = self.started_at
+
+        frames = sys._current_frames()
+        stacks = Counter(folded_stack(frames[thread_id]) for thread_id in thread_ids if thread_id in frames)
+        del frames
+
+        with self.lock:
+            # unless the profiler was started again in the meantime
+            if self.started_at == started_at:
+                self.stacks.update(stacks)
+                self.samples += 1
+
+    def status(self):
+        with self.lock:
+            return {
+                'active': self.active,
+                'started_at': self.started_at,
+                'remaining_seconds': max(0.0, self.ends_at - time.monotonic()) if self.active else 0.0,
+                'sample_rate': self.sample_rate,
+                'interval': self.interval,
+                'samples': self.samples,
+                'stacks': len(self.stacks),
+            }
+
+    def folded(self):
+        """
+        The counted stacks, one `stack count` line per stack, ready to be fed to flamegraph.pl or speedscope
+        """
+        with self.lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+sampler = Sampler()
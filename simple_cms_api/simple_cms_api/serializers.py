@@ -0,0 +1,15 @@
+from django.conf import settings
+from rest_framework import serializers
+
+
+class ProfilingSerializer(serializers.Serializer):
+    duration = serializers.FloatField(default=30)
+    sample_rate = serializers.FloatField(default=1.0, min_value=0, max_value=1)
+    interval = serializers.FloatField(default=0.01, min_value=0.001, max_value=1)
+
+    def validate_duration(self, value):
+        if not 0 < value <= settings.PROFILING_MAX_DURATION:
+            raise serializers.ValidationError(
+                f'Ensure this value is greater than 0 and at most {settings.PROFILING_MAX_DURATION}.'
+            )
+        return value
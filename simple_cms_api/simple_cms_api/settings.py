@@ -1,4 +1,6 @@
 import os
+import tempfile
+from corsheaders.defaults import default_headers
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -19,34 +21,97 @@ INSTALLED_APPS = [
     'oauth2_provider',
     'corsheaders',
     'storages',
+    'simple_cms_api',
     'users',
     'customers',
+    'webhooks',
 ]
 
+# the session, CSRF, authentication, messages and frame options middleware are skipped for the API requests
+# authenticated with a bearer token, whose token is validated once by BearerTokenMiddleware
 MIDDLEWARE = [
+    'simple_cms_api.middleware.ConcurrencyLimitMiddleware',
+    'simple_cms_api.middleware.ProfilingMiddleware',
+    'simple_cms_api.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'oauth2_provider.middleware.OAuth2TokenMiddleware',
+    'simple_cms_api.middleware.SessionMiddleware',
+    'simple_cms_api.middleware.BearerTokenMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'simple_cms_api.middleware.CsrfViewMiddleware',
+    'simple_cms_api.middleware.AuthenticationMiddleware',
+    'simple_cms_api.middleware.MessageMiddleware',
+    'simple_cms_api.middleware.XFrameOptionsMiddleware',
 ]
+BEARER_API_PATH_PREFIXES = ['/users', '/customers', '/webhooks', '/profiling']
+
+# Profiling settings
+PROFILING_MAX_DURATION = 600  # longest time (in seconds) the profiler can be left running
+
+# Response compression settings
+COMPRESSION_ENCODINGS = ['zstd', 'br', 'gzip']  # in order of preference, zstd and br need the zstandard and brotli packages
+COMPRESSION_LEVELS = {
+    'zstd': 3,  # 1-22
+    'br': 4,  # 0-11
+    'gzip': 6,  # 1-9
+}
+COMPRESSION_MIN_SIZE = 1024  # in bytes, smaller responses are sent uncompressed
 
 ROOT_URLCONF = 'simple_cms_api.urls'
 
+# use the orjson backed renderer/parser (falls back to the stdlib json module if orjson is not installed)
+FAST_JSON_ENABLED = True if os.environ.get('FAST_JSON_ENABLED') == 'True' else False
+
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'simple_cms_api.renderers.FastJSONRenderer' if FAST_JSON_ENABLED else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'simple_cms_api.renderers.FastJSONParser' if FAST_JSON_ENABLED else 'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
+        'simple_cms_api.authentication.OAuth2Authentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    'DEFAULT_THROTTLE_CLASSES': [
+        'simple_cms_api.throttling.ClientRateThrottle',
+        'simple_cms_api.throttling.UploadRateThrottle',
+        'simple_cms_api.throttling.ScopedRateThrottle',
+    ],
+    # token bucket sizes, clients can burst up to the number of requests and are then held to the average rate
+    'DEFAULT_THROTTLE_RATES': {
+        'client': '600/min',
+        'uploads': '60/min',
+        'bulk': '10/min',
+    },
 }
 
+# Throttling settings
+# throttle buckets are kept in this process' memory unless a shared cache backend (e.g. memcached) is configured, so with
+# N processes a client can make up to N times its rate
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'throttle': {
+        'BACKEND': os.environ.get('THROTTLE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('THROTTLE_CACHE_LOCATION', 'throttle'),
+    },
+}
+THROTTLE_CACHE = 'throttle'
+THROTTLE_LOCK_TIMEOUT = 1  # seconds after which the lock of a bucket expires
+THROTTLE_LOCK_WAIT = 0.1  # seconds a request waits for the lock of its bucket before it's throttled
+
+# requests handled at the same time by each process before new ones are rejected with a 503 (0 means no limit)
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS') or 0)
+CONCURRENCY_LIMIT_RETRY_AFTER = 1  # in seconds
+
 APPEND_SLASH = False
 
 AUTHENTICATION_BACKENDS = (
@@ -60,6 +125,7 @@ if os.environ.get('CORS_ORIGIN_ALLOW_ALL', 'False') == 'True':
 else:
     CORS_ORIGIN_ALLOW_ALL = False
     CORS_ORIGIN_WHITELIST = os.environ.get('CORS_ORIGIN_WHITELIST')
+CORS_ALLOW_HEADERS = list(default_headers) + ['idempotency-key']
 
 TEMPLATES = [
     {
@@ -127,11 +193,20 @@ AWS_S3_CUSTOM_DOMAIN = os.environ.get('AWS_S3_CUSTOM_DOMAIN')  # host where file
 AWS_S3_SECURE_URLS = True if os.environ.get('AWS_S3_SECURE_URLS') == 'True' else False
 AWS_QUERYSTRING_AUTH = False
 AWS_DEFAULT_ACL = None  # uploaded files will use the bucket's ACL by default
+AWS_S3_MAX_MEMORY_SIZE = 5 * 1024 * 1024  # files read from the bucket bigger than this (e.g. imports) are buffered on disk
 MEDIA_URL = 'media/'  # store all the photos in this bucket's folder
 STATIC_URL = 'static/'  # we set this so Django doesn't complain, but the setting is not used
-DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+# where the photos are stored: the S3 bucket (customers.s3_storage.S3PhotoStorage), MEDIA_ROOT on the local disk
+# (customers.storage.LocalPhotoStorage) or the memory of the process (customers.storage.InMemoryPhotoStorage)
+DEFAULT_FILE_STORAGE = os.environ.get('DEFAULT_FILE_STORAGE') or 'customers.s3_storage.S3PhotoStorage'
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT') or os.path.join(BASE_DIR, 'media')
 STATICFILES_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
 
+# Photo proxy settings
+PHOTO_CACHE_DIR = os.environ.get('PHOTO_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'simple_cms_api_photos')
+PHOTO_CACHE_MAX_SIZE = int(os.environ.get('PHOTO_CACHE_MAX_SIZE') or 512 * 1024 * 1024)  # in bytes, 0 disables the cache
+PHOTO_CHUNK_SIZE = 64 * 1024  # bytes streamed at once
+
 
 # Upload photos settings
 MAX_PHOTO_UPLOAD_SIZE = 500000  # in bytes
@@ -140,3 +215,51 @@ ACCEPTED_PHOTO_UPLOAD_FORMATS = [
     'image/jpg',
     'image/jpeg',
 ]
+
+
+# Customer imports settings
+IMPORTS_URL = 'imports/'  # store the imported files in this bucket's folder
+IMPORT_FILE_EXTENSIONS = {
+    'csv': 'csv',
+    'ndjson': 'ndjson',
+    'jsonl': 'ndjson',
+}
+IMPORT_INSERT_BATCH_SIZE = 500  # rows per INSERT statement
+IMPORT_JOB_STALE_AFTER = 300  # in seconds, running jobs without progress for this long are resumed by another worker
+
+
+# Customer history settings
+CUSTOMER_HISTORY_ENABLED = True  # record the changes of the customers in the CustomerChange outbox
+
+# customers that can be fetched at once by id (GET /customers?ids=1,2,3)
+CUSTOMER_BATCH_GET_MAX_IDS = 500
+
+# customers deactivated per UPDATE (and transaction) when deleting customers in bulk
+CUSTOMER_DEACTIVATION_CHUNK_SIZE = 5000
+
+
+# Idempotency keys settings
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # seconds the responses are replayed to the retries
+IDEMPOTENCY_KEY_LOCK_TIMEOUT = 60  # seconds after which a request that is still being handled is considered dead
+IDEMPOTENCY_WAIT_TIMEOUT = 10  # seconds a retry waits for the response of the request being handled
+IDEMPOTENCY_POLL_INTERVAL = 0.1  # seconds between the checks of a retry that is waiting
+
+
+# Webhooks settings
+WEBHOOK_BATCH_SIZE = 100  # events sent per request
+WEBHOOK_MAX_WORKERS = 8  # webhooks sent to at the same time by each dispatcher
+WEBHOOK_CONNECT_TIMEOUT = 3  # in seconds
+WEBHOOK_READ_TIMEOUT = 10  # in seconds
+WEBHOOK_BACKOFF_BASE = 5  # in seconds, doubled on every failed delivery in a row...
+WEBHOOK_BACKOFF_MAX = 3600  # ...up to this
+WEBHOOK_MAX_ATTEMPTS = 20  # failed deliveries in a row before a webhook is disabled
+WEBHOOK_CLAIM_SIZE = 100  # webhooks claimed by a dispatcher per round
+WEBHOOK_LEASE_DURATION = 5 * 60  # in seconds a claimed webhook is left to its dispatcher, longer than its rounds take
+WEBHOOK_ALLOWED_SCHEMES = ['https']  # schemes the webhook URLs can use
+WEBHOOK_ALLOW_PRIVATE_ADDRESSES = False  # let webhooks be sent to loopback, private, link-local and reserved addresses
+
+
+# Customer archive settings
+CUSTOMER_ARCHIVE_RETENTION_DAYS = int(os.environ.get('CUSTOMER_ARCHIVE_RETENTION_DAYS') or 30)  # deleted customers are archived after this many days
+CUSTOMER_ARCHIVE_PHOTO_PREFIX = 'archive/'  # move the photos of archived customers to this bucket's folder
+CUSTOMER_ARCHIVE_PHOTO_STORAGE_CLASS = os.environ.get('CUSTOMER_ARCHIVE_PHOTO_STORAGE_CLASS') or 'STANDARD_IA'
@@ -0,0 +1,40 @@
+"""
+Settings for the processes that only serve the token-authenticated JSON API. Use them with
+DJANGO_SETTINGS_MODULE=simple_cms_api.settings_api.
+
+The admin panel, sessions, messages, templates and static files are left out, along with their middleware, so the
+processes start faster and use less memory. Run the admin panel (and the management commands that need it, like
+collectstatic) with the default settings.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK
+
+UNUSED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+]
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in UNUSED_APPS]
+
+UNUSED_MIDDLEWARE = [
+    'simple_cms_api.middleware.SessionMiddleware',
+    'simple_cms_api.middleware.CsrfViewMiddleware',  # only needed by session authentication
+    'simple_cms_api.middleware.AuthenticationMiddleware',  # requests are authenticated with tokens
+    'simple_cms_api.middleware.MessageMiddleware',
+    'simple_cms_api.middleware.XFrameOptionsMiddleware',  # the API doesn't serve HTML
+]
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in UNUSED_MIDDLEWARE]
+
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': [
+        renderer for renderer in REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']
+        if renderer != 'rest_framework.renderers.BrowsableAPIRenderer'
+    ],
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'simple_cms_api.authentication.OAuth2Authentication',
+    ],
+}
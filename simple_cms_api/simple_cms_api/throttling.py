@@ -0,0 +1,131 @@
+import time
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Token bucket throttle keyed by the OAuth2 application and the user making the request.
+
+    Every bucket holds up to `num_requests` tokens and refills at `num_requests / duration` tokens per second, so a
+    client can burst up to its rate and is then held to the rate's average. Buckets live in the THROTTLE_CACHE cache,
+    which is the in-process memory cache unless a shared backend is configured. With the memory cache every process
+    has its own buckets, so with N processes a client can make up to N times its rate.
+
+    Every bucket is read and updated while holding a lock taken with the cache's add(), which is atomic in the memory
+    cache and in the shared backends (e.g. memcached), so the concurrent requests of a client, even in different
+    processes, don't spend the same token.
+    """
+    cache_format = 'throttle_%(scope)s_%(ident)s'
+
+    def __init__(self):
+        self.wait_time = None
+        super().__init__()
+
+    @property
+    def cache(self):
+        return caches[settings.THROTTLE_CACHE]
+
+    def get_rate(self):
+        # read the rates on every request instead of on import, so they can be changed with override_settings
+        self.THROTTLE_RATES = api_settings.DEFAULT_THROTTLE_RATES
+        return super().get_rate()
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            application_id = getattr(request.auth, 'application_id', None)
+            ident = f'{application_id}_{request.user.pk}'
+        else:
+            ident = self.get_ident(request)
+
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        refill_rate = self.num_requests / self.duration
+        if not self.lock_bucket():
+            # the client is making too many requests at the same time
+            self.wait_time = 1 / refill_rate
+            return False
+        try:
+            self.now = self.timer()
+            tokens, last_refill = self.cache.get(self.key, (self.num_requests, self.now))
+            tokens = min(self.num_requests, tokens + (self.now - last_refill) * refill_rate)
+            if tokens < 1:
+                self.wait_time = (1 - tokens) / refill_rate
+                return False
+
+            self.cache.set(self.key, (tokens - 1, self.now), self.duration)
+        finally:
+            self.cache.delete(f'{self.key}_lock')
+
+        return True
+
+    def lock_bucket(self):
+        """
+        Waits up to THROTTLE_LOCK_WAIT seconds for the lock of the bucket. The lock expires after THROTTLE_LOCK_TIMEOUT
+        seconds, in case the process holding it dies
+        """
+        deadline = time.monotonic() + settings.THROTTLE_LOCK_WAIT
+        while not self.cache.add(f'{self.key}_lock', True, settings.THROTTLE_LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def wait(self):
+        return self.wait_time
+
+
+class ClientRateThrottle(TokenBucketThrottle):
+    """
+    Limits every request made by a client
+    """
+    scope = 'client'
+
+
+class UploadRateThrottle(TokenBucketThrottle):
+    """
+    Stricter limit for the requests that upload files (e.g. customer photos)
+    """
+    scope = 'uploads'
+
+    def get_cache_key(self, request, view):
+        if request.method not in ('POST', 'PUT', 'PATCH') or not request.content_type.startswith('multipart/'):
+            return None
+
+        return super().get_cache_key(request, view)
+
+
+class ScopedRateThrottle(TokenBucketThrottle):
+    """
+    Limits the views that set a `throttle_scope` attribute (e.g. 'bulk') with the rate of that scope. Views that also
+    set a `throttle_methods` attribute are only limited for those methods (e.g. listing the import jobs isn't limited,
+    starting one is)
+    """
+    scope_attr = 'throttle_scope'
+    methods_attr = 'throttle_methods'
+
+    def __init__(self):
+        # the scope is only known once the view is, so the rate is set in allow_request
+        self.wait_time = None
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return True
+        methods = getattr(view, self.methods_attr, None)
+        if methods is not None and request.method not in methods:
+            return True
+
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
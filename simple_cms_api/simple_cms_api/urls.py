@@ -1,9 +1,31 @@
-from django.contrib import admin
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, include, re_path
+from . import views
 
 urlpatterns = [
-    path('admin', admin.site.urls),
     path('users', include('users.urls')),
     path('customers', include('customers.urls')),
-    path('o/', include('oauth2_provider.urls', namespace='oauth2_provider')),
+    path('webhooks', include('webhooks.urls')),
+    path('profiling', views.Profiling.as_view(), name='profiling'),
+    path('profiling/stacks', views.ProfilingStacks.as_view(), name='profiling-stacks'),
 ]
+
+if 'django.contrib.admin' in settings.INSTALLED_APPS:
+    from django.contrib import admin
+
+    urlpatterns += [
+        path('admin', admin.site.urls),
+        path('o/', include('oauth2_provider.urls', namespace='oauth2_provider')),
+    ]
+else:
+    # API-only settings (see settings_api.py): without sessions only the token endpoints can be used
+    from oauth2_provider import views as oauth2_views
+
+    oauth2_urlpatterns = [
+        re_path(r'^token/$', oauth2_views.TokenView.as_view(), name='token'),
+        re_path(r'^revoke_token/$', oauth2_views.RevokeTokenView.as_view(), name='revoke-token'),
+        re_path(r'^introspect/$', oauth2_views.IntrospectTokenView.as_view(), name='introspect'),
+    ]
+    urlpatterns += [
+        path('o/', include((oauth2_urlpatterns, 'oauth2_provider'))),
+    ]
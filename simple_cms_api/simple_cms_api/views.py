@@ -0,0 +1,38 @@
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from oauth2_provider.contrib.rest_framework import TokenHasReadWriteScope
+from .profiling import sampler
+from .serializers import ProfilingSerializer
+
+
+class Profiling(APIView):
+    """
+    Starts (POST), checks (GET) or stops (DELETE) the profiler of the process that handles the request
+    """
+    permission_classes = [IsAdminUser, TokenHasReadWriteScope]
+
+    def get(self, request):
+        return Response(sampler.status())
+
+    def post(self, request):
+        serializer = ProfilingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        sampler.start(**serializer.validated_data)
+        return Response(sampler.status(), status=status.HTTP_201_CREATED)
+
+    def delete(self, request):
+        sampler.stop()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ProfilingStacks(APIView):
+    """
+    Stacks sampled by the profiler in the folded format of flamegraph.pl
+    """
+    permission_classes = [IsAdminUser, TokenHasReadWriteScope]
+
+    def get(self, request):
+        return HttpResponse(sampler.folded(), content_type='text/plain; charset=utf-8')
@@ -1,3 +1,11 @@
 from django.contrib import admin
+from .models import Organization, Profile
 
-# Register your models here.
+
+admin.site.register(Organization)
+
+
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+    list_display = ('user', 'organization')
+    list_filter = ('organization',)
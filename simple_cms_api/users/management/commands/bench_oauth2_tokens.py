@@ -0,0 +1,85 @@
+import statistics
+import time
+from datetime import timedelta
+from io import StringIO
+from uuid import uuid4
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model, get_application_model
+from oauth2_provider.oauth2_validators import OAuth2Validator
+from oauthlib.common import Request
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark purge_oauth2_tokens, and the latency (p50/p99) of a bearer token lookup before and after the ' \
+           'expired tokens are purged. Everything is done inside a transaction that is rolled back at the end.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expired', type=int, nargs='+', default=[10000, 100000], help='expired tokens per run')
+        parser.add_argument('--lookups', type=int, default=1000, help='token lookups before and after the purge')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['expired'], options['lookups'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def run(self, runs, num_lookups):
+        AccessToken = get_access_token_model()
+        user = get_user_model().objects.create(username=f'bench_{uuid4().hex}')
+        application = get_application_model().objects.create(
+            name='bench',
+            user=user,
+            client_type='confidential',
+            authorization_grant_type='authorization-code'
+        )
+        token = AccessToken.objects.create(
+            user=user,
+            token=uuid4().hex,
+            application=application,
+            expires=timezone.now() + timedelta(days=1),
+            scope='read write'
+        )
+        validator = OAuth2Validator()
+
+        def lookup():
+            # the lookup done by the OAuth2 authentication of every request with a bearer token
+            start = time.perf_counter()
+            valid = validator.validate_bearer_token(token.token, ['read'], Request('/'))
+            elapsed = time.perf_counter() - start
+            assert valid
+            return elapsed
+
+        def report(timings):
+            quantiles = statistics.quantiles(timings, n=100)
+            return f'p50={quantiles[49] * 1000:.2f}ms p99={quantiles[98] * 1000:.2f}ms'
+
+        # warm up
+        for _ in range(min(num_lookups, 200)):
+            lookup()
+
+        for num_expired in runs:
+            expired = timezone.now() - timedelta(days=1)
+            AccessToken.objects.bulk_create([
+                AccessToken(user=user, token=uuid4().hex, application=application, expires=expired, scope='read write')
+                for _ in range(num_expired)
+            ], batch_size=500)
+
+            before = [lookup() for _ in range(num_lookups)]
+            start = time.perf_counter()
+            call_command('purge_oauth2_tokens', stdout=StringIO())
+            purge_time = time.perf_counter() - start
+            after = [lookup() for _ in range(num_lookups)]
+
+            self.stdout.write(f'{num_expired} expired tokens: purged in {purge_time:.2f}s '
+                              f'({num_expired / purge_time:,.0f} tokens/s), lookup before purge {report(before)}, '
+                              f'after purge {report(after)}')
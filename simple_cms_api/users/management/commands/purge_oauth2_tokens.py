@@ -0,0 +1,62 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model, get_grant_model, get_refresh_token_model
+from oauth2_provider.settings import oauth2_settings
+
+
+class Command(BaseCommand):
+    help = 'Delete expired and revoked OAuth2 access tokens, refresh tokens and grants in small batches. ' \
+           'Meant to be run periodically (e.g. from cron).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0, help='seconds to wait between batches')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.pause = options['pause']
+        started = time.monotonic()
+
+        AccessToken = get_access_token_model()
+        RefreshToken = get_refresh_token_model()
+        Grant = get_grant_model()
+        now = timezone.now()
+
+        # revoked refresh tokens are only kept during the grace period, expired ones only if they expire at all
+        revoked_before = now - timedelta(seconds=oauth2_settings.REFRESH_TOKEN_GRACE_PERIOD_SECONDS)
+        refresh_tokens = [RefreshToken.objects.filter(revoked__lt=revoked_before)]
+        if oauth2_settings.REFRESH_TOKEN_EXPIRE_SECONDS:
+            expire_seconds = oauth2_settings.REFRESH_TOKEN_EXPIRE_SECONDS
+            if not isinstance(expire_seconds, timedelta):
+                expire_seconds = timedelta(seconds=expire_seconds)
+            refresh_tokens.append(RefreshToken.objects.filter(access_token__expires__lt=now - expire_seconds))
+
+        counts = [
+            ('refresh tokens', sum(self.purge(queryset) for queryset in refresh_tokens)),
+            # expired access tokens that can still be refreshed are deleted along with their refresh token
+            ('access tokens', self.purge(AccessToken.objects.filter(expires__lt=now, refresh_token__isnull=True))),
+            ('grants', self.purge(Grant.objects.filter(expires__lt=now))),
+        ]
+
+        report = ', '.join(f'{count} {name}' for name, count in counts)
+        self.stdout.write(f'Deleted {report} in {time.monotonic() - started:.2f}s')
+
+    def purge(self, queryset):
+        """
+        Deletes the rows of the queryset in batches, each one in its own short transaction
+        """
+        deleted = 0
+        while True:
+            pks = list(queryset.order_by().values_list('pk', flat=True)[:self.batch_size])
+            if not pks:
+                return deleted
+
+            with transaction.atomic():
+                queryset.model.objects.filter(pk__in=pks).delete()
+            deleted += len(pks)
+
+            if self.pause:
+                time.sleep(self.pause)
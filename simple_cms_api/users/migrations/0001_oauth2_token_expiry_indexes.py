@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from oauth2_provider.settings import oauth2_settings
+
+# indexes used by the purge_oauth2_tokens command to find expired and revoked tokens without scanning the tables
+INDEXES = [
+    (oauth2_settings.ACCESS_TOKEN_MODEL, models.Index(fields=['expires'], name='oauth2_accesstoken_exp_idx')),
+    (oauth2_settings.REFRESH_TOKEN_MODEL, models.Index(fields=['revoked'], name='oauth2_refreshtoken_rev_idx')),
+    (oauth2_settings.GRANT_MODEL, models.Index(fields=['expires'], name='oauth2_grant_exp_idx')),
+]
+
+
+def add_indexes(apps, schema_editor):
+    for model_name, index in INDEXES:
+        model = apps.get_model(model_name)
+        if schema_editor.connection.vendor == 'postgresql':
+            # build the indexes without locking the token tables against writes
+            schema_editor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {schema_editor.quote_name(index.name)} '
+                f'ON {schema_editor.quote_name(model._meta.db_table)} ({schema_editor.quote_name(index.fields[0])})'
+            )
+        else:
+            schema_editor.add_index(model, index)
+
+
+def remove_indexes(apps, schema_editor):
+    for model_name, index in INDEXES:
+        schema_editor.remove_index(apps.get_model(model_name), index)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('oauth2_provider', '0002_auto_20190406_1805'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_indexes, remove_indexes),
+    ]
@@ -1,3 +1,28 @@
 from django.db import models
+from django.conf import settings
 
-# Create your models here.
+
+class Organization(models.Model):
+    """
+    Tenant that owns customers. Users only see the customers of their organization
+    """
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Profile(models.Model):
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, related_name="profile", on_delete=models.CASCADE)
+    organization = models.ForeignKey(Organization, related_name="members", null=True, on_delete=models.PROTECT)
+
+
+def get_organization_id(user):
+    """
+    Returns the id of the user's organization, or None if the user doesn't belong to any.
+    The result is cached in the user instance, so it's only queried once per request
+    """
+    if not hasattr(user, '_organization_id'):
+        user._organization_id = Profile.objects.filter(user=user).values_list('organization_id', flat=True).first()
+
+    return user._organization_id
@@ -1,9 +1,16 @@
 import datetime
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory
 from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from rest_framework import status
 from rest_framework.test import APITestCase
+from simple_cms_api.middleware import ProfilingMiddleware
+from simple_cms_api.profiling import folded_stack, sampler
 from oauth2_provider.models import (
     get_access_token_model, get_application_model,
     get_grant_model, get_refresh_token_model
@@ -12,6 +19,8 @@ from oauth2_provider.models import (
 UserModel = get_user_model()
 AccessToken = get_access_token_model()
 Application = get_application_model()
+Grant = get_grant_model()
+RefreshToken = get_refresh_token_model()
 
 
 class UserCreate(APITestCase):
@@ -359,3 +368,182 @@ class UserRetrieveUpdateDestroyA(APITestCase):
         # check that the user does not exist in the database after deleting it
         num_users = UserModel.objects.filter(id=self.user_to_edit.id).count()
         self.assertEqual(num_users, 0)
+
+
+class PurgeOAuth2Tokens(APITestCase):
+    # number of expired/revoked rows seeded for each kind of token
+    num_expired = 2500
+
+    def setUp(self):
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+        self.application = Application.objects.create(
+            name="Test Application",
+            redirect_uris=("http://localhost"),
+            user=self.normal_user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        self.normal_user_accesstoken = AccessToken.objects.create(
+            user=self.normal_user,
+            token="1234567890",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+        self.normal_user_refreshtoken = RefreshToken.objects.create(
+            user=self.normal_user,
+            token="refresh_1234567890",
+            application=self.application,
+            access_token=self.normal_user_accesstoken
+        )
+
+        expired = timezone.now() - datetime.timedelta(days=1)
+        AccessToken.objects.bulk_create([
+            AccessToken(user=self.normal_user, token=f'expired_{i}', application=self.application, expires=expired)
+            for i in range(self.num_expired)
+        ], batch_size=500)
+        RefreshToken.objects.bulk_create([
+            RefreshToken(user=self.normal_user, token=f'revoked_{i}', application=self.application, revoked=expired)
+            for i in range(self.num_expired)
+        ], batch_size=500)
+        Grant.objects.bulk_create([
+            Grant(user=self.normal_user, code=f'expired_{i}', application=self.application, expires=expired,
+                  redirect_uri='http://localhost')
+            for i in range(self.num_expired)
+        ], batch_size=500)
+
+    def test_purge_expired_tokens(self):
+        """
+        Ensure expired and revoked tokens and grants are deleted in batches and valid tokens are kept
+        """
+
+        out = StringIO()
+        call_command('purge_oauth2_tokens', batch_size=1000, stdout=out)
+
+        self.assertIn(f'Deleted {self.num_expired} refresh tokens, {self.num_expired} access tokens, '
+                      f'{self.num_expired} grants', out.getvalue())
+        self.assertEqual(list(AccessToken.objects.values_list('token', flat=True)), ['1234567890'])
+        self.assertEqual(list(RefreshToken.objects.values_list('token', flat=True)), ['refresh_1234567890'])
+        self.assertFalse(Grant.objects.exists())
+
+    def test_token_still_authenticates_after_purge(self):
+        """
+        Ensure valid access tokens keep authenticating requests after a purge
+        """
+
+        call_command('purge_oauth2_tokens', stdout=StringIO())
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        response = self.client.get(reverse('customers:customers-list'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class SamplingProfiler(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('profiling')
+
+        self.admin_user = UserModel.objects.create(
+            username='my_test_admin_username',
+            password='my_test_admin_password',
+            is_staff=True
+        )
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+
+        self.application = Application.objects.create(
+            name="Test Application",
+            redirect_uris=("http://localhost"),
+            user=self.admin_user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+
+        self.admin_user_accesstoken = AccessToken.objects.create(
+            user=self.admin_user,
+            token="0987654321",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+        self.normal_user_accesstoken = AccessToken.objects.create(
+            user=self.normal_user,
+            token="1234567890",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+
+    def tearDown(self):
+        sampler.stop()
+
+    def test_normal_user_start_profiler_failure(self):
+        """
+        Ensure a normal user can't start the profiler
+        """
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        response = self.client.post(self.url, {'duration': 10}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(sampler.active)
+
+    def test_admin_user_profile_requests(self):
+        """
+        Ensure an admin user can start the profiler, get the folded stacks of the profiled requests and stop it
+        """
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.admin_user_accesstoken.token)
+        response = self.client.post(self.url, {'duration': 10, 'interval': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data['active'])
+
+        def profiled_view(request):
+            # take a sample from inside the request instead of waiting for the sampling thread
+            sampler.sample()
+            return HttpResponse()
+
+        def folded_stack_unlocked(frame):
+            # the stacks are walked without holding the lock, so the requests can start and end meanwhile
+            self.assertTrue(sampler.lock.acquire(blocking=False))
+            sampler.lock.release()
+            return folded_stack(frame)
+
+        with mock.patch('simple_cms_api.profiling.folded_stack', side_effect=folded_stack_unlocked):
+            ProfilingMiddleware(profiled_view)(RequestFactory().get('/customers'))
+
+        response = self.client.get(reverse('profiling-stacks'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        stack, count = response.content.decode().splitlines()[0].rsplit(' ', 1)
+        self.assertIn('simple_cms_api.middleware:__call__;users.tests:profiled_view', stack)
+        self.assertEqual(count, '1')
+
+        response = self.client.delete(self.url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(sampler.active)
+
+    def test_admin_user_start_profiler_too_long_failure(self):
+        """
+        Ensure the profiler can't be left running for longer than PROFILING_MAX_DURATION
+        """
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.admin_user_accesstoken.token)
+        response = self.client.post(self.url, {'duration': 100000}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(sampler.active)
+
+    def test_requests_not_profiled_when_profiler_stopped(self):
+        """
+        Ensure the requests don't go through the profiler while it's stopped
+        """
+
+        with mock.patch.object(sampler, 'track') as track:
+            ProfilingMiddleware(lambda request: HttpResponse())(RequestFactory().get('/customers'))
+        track.assert_not_called()
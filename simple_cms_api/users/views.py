@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
+from django.http import Http404
 from .serializers import UserSerializer
-from rest_framework import generics
+from rest_framework import generics, status
+from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser
 from oauth2_provider.contrib.rest_framework import TokenHasReadWriteScope
 
@@ -15,6 +17,14 @@ class UserDetail(generics.RetrieveUpdateDestroyAPIView):
     queryset = get_user_model().objects.filter(is_active=True)
     serializer_class = UserSerializer
 
-    def perform_destroy(self, instance):
-        instance.is_active = False
-        instance.save(update_fields=['is_active'])
\ No newline at end of file
+    def destroy(self, request, *args, **kwargs):
+        # deactivated with a single UPDATE, without reading the user first
+        try:
+            deactivated = self.get_queryset().filter(pk=kwargs['pk']).update(is_active=False)
+        except (TypeError, ValueError):
+            raise Http404()
+
+        if not deactivated:
+            raise Http404()
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
@@ -0,0 +1,9 @@
+from django.contrib import admin
+from .models import Webhook
+
+
+@admin.register(Webhook)
+class WebhookAdmin(admin.ModelAdmin):
+    list_display = ('url', 'organization', 'is_active', 'last_event_id', 'attempts', 'next_attempt_at')
+    list_filter = ('organization', 'is_active')
+    readonly_fields = ('secret',)
@@ -0,0 +1,175 @@
+import hashlib
+import hmac
+import json
+import random
+import time
+import urllib3
+from datetime import timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from customers.models import CustomerHistory
+from .models import Webhook
+from .targets import DEFAULT_PORTS, UnsafeWebhookURL, resolve_webhook_url
+
+SIGNATURE_HEADER = 'X-Webhook-Signature'
+TIMESTAMP_HEADER = 'X-Webhook-Timestamp'
+
+
+def pool_manager(max_workers):
+    """
+    Connection pools shared by all the deliveries, so the connections to every webhook host are kept alive and reused
+    """
+    return urllib3.PoolManager(
+        num_pools=100,
+        maxsize=max_workers,
+        timeout=urllib3.Timeout(connect=settings.WEBHOOK_CONNECT_TIMEOUT, read=settings.WEBHOOK_READ_TIMEOUT),
+        retries=False
+    )
+
+
+def dispatch(http, executor, batch_size):
+    """
+    Sends the pending events of every due webhook, up to batch_size events per webhook in a single POST. The webhooks
+    are sent to concurrently. Returns the number of (delivered, failed) deliveries.
+
+    No transaction is kept open while sending: the due webhooks are claimed first, then sent to, and the result of
+    every delivery is saved on its own.
+    """
+    delivered = failed = 0
+    deliveries = []
+    for webhook, events, leased_until in claim_webhooks(batch_size):
+        body = encode_events(webhook, events)
+        deliveries.append((webhook, events, leased_until, executor.submit(deliver, http, webhook, body)))
+
+    for webhook, events, leased_until, future in deliveries:
+        error = future.result()
+        if error is None:
+            update = {'last_event_id': events[-1]['id'], 'attempts': 0, 'next_attempt_at': None, 'last_error': ''}
+            delivered += 1
+        else:
+            attempts = webhook.attempts + 1
+            update = {
+                'attempts': attempts,
+                'next_attempt_at': timezone.now() + backoff(attempts),
+                'last_error': error,
+                # webhooks that keep failing are disabled until they are activated again
+                'is_active': attempts < settings.WEBHOOK_MAX_ATTEMPTS,
+            }
+            failed += 1
+        with transaction.atomic():
+            # only if the webhook is still claimed by this round (and wasn't e.g. reactivated in the meantime)
+            Webhook.objects.filter(id=webhook.id, next_attempt_at=leased_until).update(**update)
+
+    return delivered, failed
+
+
+def claim_webhooks(batch_size):
+    """
+    Returns the (webhook, events, leased_until) of up to WEBHOOK_CLAIM_SIZE due webhooks with pending events, claimed
+    by moving their next attempt to the end of a WEBHOOK_LEASE_DURATION lease. Other dispatchers skip them until then,
+    so they run at the same time without delivering the same events twice, and the webhooks of a dispatcher that dies
+    are retried once the lease ends
+    """
+    now = timezone.now()
+    leased_until = now + timedelta(seconds=settings.WEBHOOK_LEASE_DURATION)
+    # the webhooks without pending events are left out before the due webhooks are limited, or the first ones would
+    # be examined every round and the rest never delivered to
+    events_after_last = CustomerHistory.objects.filter(id__gt=OuterRef('last_event_id'))
+    with transaction.atomic():
+        webhooks = Webhook.objects.select_for_update(skip_locked=True).annotate(
+            has_organization_events=Exists(events_after_last.filter(organization_id=OuterRef('organization_id'))),
+            has_unowned_events=Exists(events_after_last.filter(organization_id__isnull=True)),
+        ).filter(
+            Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+            Q(organization__isnull=False, has_organization_events=True) | Q(organization__isnull=True, has_unowned_events=True),
+            is_active=True
+        ).order_by('last_event_id', 'id')  # the webhooks furthest behind first
+
+        claimed = []
+        for webhook in webhooks[:settings.WEBHOOK_CLAIM_SIZE]:
+            events = pending_events(webhook, batch_size)
+            if events:
+                claimed.append((webhook, events, leased_until))
+        Webhook.objects.filter(id__in=[webhook.id for webhook, _, _ in claimed]).update(next_attempt_at=leased_until)
+
+    return claimed
+
+
+def pending_events(webhook, batch_size):
+    """
+    Changes of the customers of the webhook's organization after the last one delivered, oldest first
+    """
+    history = CustomerHistory.objects.filter(id__gt=webhook.last_event_id)
+    if webhook.organization_id is None:
+        history = history.filter(organization_id__isnull=True)
+    else:
+        history = history.filter(organization_id=webhook.organization_id)
+
+    return [
+        {
+            'id': row.id,
+            'customer_id': row.customer_id,
+            'action': row.action,
+            'changes': row.decoded_changes,
+            'changed_by': row.changed_by_id,
+            'changed_at': row.changed_at,
+        }
+        for row in history.order_by('id')[:batch_size]
+    ]
+
+
+def encode_events(webhook, events):
+    return json.dumps({'webhook': webhook.id, 'events': events}, cls=DjangoJSONEncoder).encode()
+
+
+def sign(secret, timestamp, body):
+    """
+    HMAC-SHA256 of the timestamp and the body, so receivers can check the request was sent by us (and recently)
+    """
+    message = f'{timestamp}.'.encode() + body
+    return 'sha256=' + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def deliver(http, webhook, body):
+    """
+    POSTs the events to the webhook. Returns None if the webhook accepted them, or the reason why it didn't.
+
+    The URL is checked again, since its host may resolve to another address now than when the webhook was registered,
+    and the connection is made to the checked address. Redirects aren't followed.
+    """
+    try:
+        target = resolve_webhook_url(webhook.url)
+    except UnsafeWebhookURL as exc:
+        return str(exc)
+
+    # the pools are per address, with the host used for the TLS handshake and the certificate check
+    pool_kwargs = {'server_hostname': target.host, 'assert_hostname': target.host} if target.scheme == 'https' else None
+    host_header = f'[{target.host}]' if ':' in target.host else target.host
+    if target.port != DEFAULT_PORTS[target.scheme]:
+        host_header += f':{target.port}'
+    timestamp = str(int(time.time()))
+    try:
+        pool = http.connection_from_host(target.address, target.port, target.scheme, pool_kwargs=pool_kwargs)
+        response = pool.urlopen('POST', target.path, body=body, headers={
+            'Host': host_header,
+            'Content-Type': 'application/json',
+            TIMESTAMP_HEADER: timestamp,
+            SIGNATURE_HEADER: sign(webhook.secret, timestamp, body),
+        }, redirect=False, assert_same_host=False, retries=False)
+    except urllib3.exceptions.HTTPError as exc:
+        return str(exc)
+
+    if not 200 <= response.status < 300:
+        return f'HTTP {response.status}'
+    return None
+
+
+def backoff(attempts):
+    """
+    Exponential backoff with jitter, so the webhooks that failed at the same time aren't all retried at the same time
+    """
+    delay = min(settings.WEBHOOK_BACKOFF_BASE * 2 ** (attempts - 1), settings.WEBHOOK_BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
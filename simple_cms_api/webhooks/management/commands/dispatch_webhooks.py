@@ -0,0 +1,28 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from webhooks.dispatch import dispatch, pool_manager
+
+
+class Command(BaseCommand):
+    help = 'Worker that delivers the customer changes to the registered webhooks. Several workers can run at the same time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.WEBHOOK_BATCH_SIZE, help='events sent per request')
+        parser.add_argument('--workers', type=int, default=settings.WEBHOOK_MAX_WORKERS, help='webhooks sent to at the same time')
+        parser.add_argument('--poll-interval', type=float, default=1, help='seconds to wait when there is nothing to deliver')
+        parser.add_argument('--once', action='store_true', help='exit when there is nothing left to deliver')
+
+    def handle(self, *args, **options):
+        http = pool_manager(options['workers'])
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                started = time.monotonic()
+                delivered, failed = dispatch(http, executor, options['batch_size'])
+                if delivered or failed:
+                    self.stdout.write(f'Delivered {delivered} batches, {failed} failed in {time.monotonic() - started:.2f}s')
+                elif options['once']:
+                    return
+                else:
+                    time.sleep(options['poll_interval'])
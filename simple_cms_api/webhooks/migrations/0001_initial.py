@@ -0,0 +1,39 @@
+# Generated by Django 3.0.7 on 2026-10-19 19:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import webhooks.models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0002_organization_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Webhook',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500)),
+                ('secret', models.CharField(default=webhooks.models.generate_secret, editable=False, max_length=64)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='webhooks_created', to=settings.AUTH_USER_MODEL)),
+                ('organization', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='webhooks', to='users.Organization')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='webhook',
+            index=models.Index(fields=['is_active', 'next_attempt_at'], name='webhooks_due_idx'),
+        ),
+    ]
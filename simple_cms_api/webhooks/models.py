@@ -0,0 +1,31 @@
+import secrets
+from django.conf import settings
+from django.db import models
+
+
+def generate_secret():
+    return secrets.token_hex(32)
+
+
+class Webhook(models.Model):
+    """
+    URL that the changes of the customers of an organization are POSTed to by the dispatch_webhooks command.
+
+    last_event_id is the id of the last CustomerHistory row delivered, so every webhook follows the history at its own
+    pace. Failed deliveries are retried with exponential backoff from the same event.
+    """
+    url = models.URLField(max_length=500)
+    secret = models.CharField(max_length=64, default=generate_secret, editable=False)  # HMAC-SHA256 key of the signatures
+    organization = models.ForeignKey('users.Organization', related_name="webhooks", null=True, on_delete=models.PROTECT)
+    is_active = models.BooleanField(default=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="webhooks_created", null=False, on_delete=models.PROTECT)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_event_id = models.BigIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)  # failed deliveries in a row
+    next_attempt_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'next_attempt_at'], name='webhooks_due_idx'),
+        ]
@@ -0,0 +1,57 @@
+from rest_framework import serializers
+from customers.models import CustomerHistory
+from users.models import get_organization_id
+from .models import Webhook
+from .targets import UnsafeWebhookURL, resolve_webhook_url
+
+
+class WebhookSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Webhook
+        fields = (
+            'id',
+            'url',
+            'secret',
+            'is_active',
+            'created_by',
+            'created_at',
+            'last_event_id',
+            'attempts',
+            'next_attempt_at',
+            'last_error',
+        )
+        read_only_fields = (
+            'secret',
+            'created_by',
+            'created_at',
+            'last_event_id',
+            'attempts',
+            'next_attempt_at',
+            'last_error',
+        )
+
+    def validate_url(self, value):
+        try:
+            resolve_webhook_url(value)
+        except UnsafeWebhookURL as exc:
+            raise serializers.ValidationError(str(exc))
+        return value
+
+    def create(self, validated_data):
+        user_creating = self.context['request'].user
+        webhook = Webhook(**validated_data)
+        webhook.created_by = user_creating
+        webhook.organization_id = get_organization_id(user_creating)
+        # new webhooks only get the changes made from now on
+        last_event = CustomerHistory.objects.order_by('-id').values_list('id', flat=True).first()
+        webhook.last_event_id = last_event or 0
+        webhook.save()
+
+        return webhook
+
+    def update(self, instance, validated_data):
+        if validated_data.get('is_active') and not instance.is_active:
+            # retry a disabled webhook right away
+            instance.attempts = 0
+            instance.next_attempt_at = None
+        return super().update(instance, validated_data)
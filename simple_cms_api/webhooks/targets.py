@@ -0,0 +1,56 @@
+import ipaddress
+import socket
+from collections import namedtuple
+from urllib.parse import urlsplit
+from django.conf import settings
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# where a webhook is delivered: the address its host resolved to, and the host, port and path to request from it
+WebhookTarget = namedtuple('WebhookTarget', ['scheme', 'host', 'port', 'address', 'path'])
+
+
+class UnsafeWebhookURL(ValueError):
+    pass
+
+
+def is_public_address(address):
+    ip = ipaddress.ip_address(address.split('%')[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    # is_global excludes the loopback, private, link-local (e.g. the cloud metadata service), shared and reserved ranges
+    return ip.is_global and not ip.is_multicast
+
+
+def resolve_webhook_url(url):
+    """
+    Resolves the host of a webhook URL and returns the WebhookTarget to connect to. Raises UnsafeWebhookURL if the URL
+    doesn't use one of WEBHOOK_ALLOWED_SCHEMES, or if its host resolves to an address that isn't public (unless
+    WEBHOOK_ALLOW_PRIVATE_ADDRESSES is set), so webhooks can't be used to reach the internal network.
+
+    The connection has to be made to the returned address, not to the host, so the host can't resolve to another
+    address by then.
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in settings.WEBHOOK_ALLOWED_SCHEMES:
+        raise UnsafeWebhookURL(f'Webhook URLs must use {" or ".join(settings.WEBHOOK_ALLOWED_SCHEMES)}.')
+
+    try:
+        host, port = parts.hostname, parts.port or DEFAULT_PORTS[scheme]
+    except ValueError:
+        raise UnsafeWebhookURL('The port of the webhook URL is not valid.')
+    if not host:
+        raise UnsafeWebhookURL('The webhook URL has no host.')
+
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    except (socket.gaierror, UnicodeError):
+        raise UnsafeWebhookURL(f'The host {host} can not be resolved.')
+    if not settings.WEBHOOK_ALLOW_PRIVATE_ADDRESSES and not all(is_public_address(address) for address in addresses):
+        raise UnsafeWebhookURL(f'The host {host} resolves to an address that is not public.')
+
+    path = parts.path or '/'
+    if parts.query:
+        path += f'?{parts.query}'
+    return WebhookTarget(scheme, host, port, addresses[0], path)
@@ -0,0 +1,266 @@
+import datetime
+import hashlib
+import hmac
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from customers.history import relay_changes
+from users.models import Organization, Profile
+from .dispatch import SIGNATURE_HEADER, TIMESTAMP_HEADER, claim_webhooks
+from .models import Webhook
+from oauth2_provider.models import get_access_token_model, get_application_model
+
+UserModel = get_user_model()
+AccessToken = get_access_token_model()
+Application = get_application_model()
+
+
+class WebhookReceiver(BaseHTTPRequestHandler):
+    """
+    Stand-in for the HTTP server of an integration: records the requests and answers with the server's status
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.received.append((self.headers, body, self.client_address))
+        self.send_response(self.server.response_status)
+        if self.server.response_status in (301, 302, 307, 308):
+            self.send_header('Location', f'http://127.0.0.1:{self.server.server_address[1]}/redirected')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+# the webhooks of the tests are sent to a local HTTP server
+@override_settings(WEBHOOK_ALLOWED_SCHEMES=['http', 'https'], WEBHOOK_ALLOW_PRIVATE_ADDRESSES=True)
+class WebhookDispatch(APITestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), WebhookReceiver)
+        self.server.received = []
+        self.server.response_status = 200
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.organization = Organization.objects.create(name='my_test_organization')
+        self.normal_user = UserModel.objects.create(
+            username='my_test_normal_username',
+            password='my_test_normal_password',
+            is_staff=False
+        )
+        Profile.objects.create(user=self.normal_user, organization=self.organization)
+        self.application = Application.objects.create(
+            name="Test Application",
+            redirect_uris=("http://localhost"),
+            user=self.normal_user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        self.normal_user_accesstoken = AccessToken.objects.create(
+            user=self.normal_user,
+            token="1234567890",
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+            scope="read write"
+        )
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.normal_user_accesstoken.token)
+        response = self.client.post(
+            reverse('webhooks:webhooks-list'),
+            {'url': f'http://127.0.0.1:{self.server.server_address[1]}/hook'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.webhook = Webhook.objects.get(id=response.data['id'])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_customers(self, *names):
+        for name in names:
+            self.client.post(reverse('customers:customers-list'), {'name': name, 'surname': 'Doe'}, format='json')
+        relay_changes(batch_size=100)
+
+    def dispatch(self):
+        call_command('dispatch_webhooks', once=True, stdout=StringIO())
+
+    def test_anonymous_user_create_webhook_failure(self):
+        """
+        Ensure an anonymous user can't register a webhook
+        """
+
+        self.client.credentials()
+        response = self.client.post(reverse('webhooks:webhooks-list'), {'url': 'http://localhost/hook'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deliver_customer_changes_in_batches(self):
+        """
+        Ensure the customer changes are POSTed in batches, signed with the secret of the webhook
+        """
+
+        self.create_customers('John', 'Jane', 'Jim')
+        with override_settings(WEBHOOK_BATCH_SIZE=2):
+            self.dispatch()
+
+        self.assertEqual(len(self.server.received), 2)
+        events = []
+        for headers, body, _ in self.server.received:
+            message = f'{headers[TIMESTAMP_HEADER]}.'.encode() + body
+            signature = 'sha256=' + hmac.new(self.webhook.secret.encode(), message, hashlib.sha256).hexdigest()
+            self.assertEqual(headers[SIGNATURE_HEADER], signature)
+            events.extend(json.loads(body)['events'])
+
+        self.assertEqual([event['changes']['name'][1] for event in events], ['John', 'Jane', 'Jim'])
+        self.assertEqual({event['action'] for event in events}, {'created'})
+
+        # the connection to the webhook is kept alive between batches
+        self.assertEqual(len({client_address for _, _, client_address in self.server.received}), 1)
+
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.last_event_id, events[-1]['id'])
+
+        # nothing is delivered twice
+        self.dispatch()
+        self.assertEqual(len(self.server.received), 2)
+
+    def test_failed_delivery_retried_with_backoff(self):
+        """
+        Ensure a failed delivery is retried later from the same event
+        """
+
+        self.create_customers('John')
+        self.server.response_status = 500
+        self.dispatch()
+
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.attempts, 1)
+        self.assertEqual(self.webhook.last_error, 'HTTP 500')
+        self.assertEqual(self.webhook.last_event_id, 0)
+        self.assertGreater(self.webhook.next_attempt_at, timezone.now())
+
+        # not retried before its next attempt
+        self.server.response_status = 200
+        self.dispatch()
+        self.assertEqual(len(self.server.received), 1)
+
+        Webhook.objects.filter(id=self.webhook.id).update(next_attempt_at=timezone.now())
+        self.dispatch()
+        self.assertEqual(len(self.server.received), 2)
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.attempts, 0)
+        self.assertNotEqual(self.webhook.last_event_id, 0)
+
+    def test_other_organization_changes_not_delivered(self):
+        """
+        Ensure a webhook only gets the changes of the customers of its organization
+        """
+
+        Webhook.objects.filter(id=self.webhook.id).update(organization=Organization.objects.create(name='my_test_other_organization'))
+        self.create_customers('John')
+        self.dispatch()
+        self.assertEqual(self.server.received, [])
+
+    def test_create_webhook_unsafe_url_failure(self):
+        """
+        Ensure a webhook can't be registered with a URL that isn't https or whose host isn't public
+        """
+
+        public_address = [(2, 1, 6, '', ('93.184.216.34', 443))]
+        with override_settings(WEBHOOK_ALLOWED_SCHEMES=['https'], WEBHOOK_ALLOW_PRIVATE_ADDRESSES=False), \
+                mock.patch('socket.getaddrinfo', return_value=public_address):
+            response = self.client.post(reverse('webhooks:webhooks-list'), {'url': 'http://example.com/hook'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            response = self.client.post(reverse('webhooks:webhooks-list'), {'url': 'https://example.com/hook'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        with override_settings(WEBHOOK_ALLOWED_SCHEMES=['https'], WEBHOOK_ALLOW_PRIVATE_ADDRESSES=False):
+            for url in (
+                'https://127.0.0.1/hook',
+                'https://localhost/hook',
+                'https://10.0.0.1/hook',
+                'https://169.254.169.254/latest/meta-data/',
+                'https://[::1]/hook',
+                'https://[::ffff:192.168.0.1]/hook',
+            ):
+                response = self.client.post(reverse('webhooks:webhooks-list'), {'url': url}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, url)
+                self.assertIn('url', response.data)
+
+    def test_delivery_unsafe_address_not_sent(self):
+        """
+        Ensure the address of a webhook is checked again when delivering to it
+        """
+
+        self.create_customers('John')
+        with override_settings(WEBHOOK_ALLOW_PRIVATE_ADDRESSES=False):
+            self.dispatch()
+
+        self.assertEqual(self.server.received, [])
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.attempts, 1)
+        self.assertIn('not public', self.webhook.last_error)
+
+    def test_redirect_not_followed(self):
+        """
+        Ensure a redirect answered by a webhook isn't followed, and counts as a failed delivery
+        """
+
+        self.create_customers('John')
+        self.server.response_status = 302
+        self.dispatch()
+
+        self.assertEqual(len(self.server.received), 1)
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.last_error, 'HTTP 302')
+        self.assertEqual(self.webhook.attempts, 1)
+
+    def test_claimed_webhook_not_delivered_twice(self):
+        """
+        Ensure a webhook claimed by a dispatcher is skipped by the others until its lease ends
+        """
+
+        self.create_customers('John')
+        # a dispatcher claimed the webhook, and died before delivering to it
+        claimed = claim_webhooks(batch_size=100)
+        self.assertEqual([webhook.id for webhook, _, _ in claimed], [self.webhook.id])
+        self.assertEqual(claim_webhooks(batch_size=100), [])
+
+        self.dispatch()
+        self.assertEqual(self.server.received, [])
+
+        Webhook.objects.filter(id=self.webhook.id).update(next_attempt_at=timezone.now())
+        self.dispatch()
+        self.assertEqual(len(self.server.received), 1)
+        self.webhook.refresh_from_db()
+        self.assertIsNone(self.webhook.next_attempt_at)
+        self.assertNotEqual(self.webhook.last_event_id, 0)
+
+    def test_webhooks_without_pending_events_not_claimed(self):
+        """
+        Ensure the webhooks without pending events don't take the place of the ones with events in a round
+        """
+
+        Webhook.objects.filter(id=self.webhook.id).update(organization=Organization.objects.create(name='my_test_other_organization'))
+        Webhook.objects.create(
+            url=self.webhook.url,
+            organization=Organization.objects.create(name='my_test_another_organization'),
+            created_by=self.normal_user
+        )
+        webhook = Webhook.objects.create(url=self.webhook.url, organization=self.organization, created_by=self.normal_user)
+        self.create_customers('John')
+
+        with override_settings(WEBHOOK_CLAIM_SIZE=2):
+            claimed = claim_webhooks(batch_size=100)
+        self.assertEqual([claimed_webhook.id for claimed_webhook, _, _ in claimed], [webhook.id])
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = 'webhooks'
+
+urlpatterns = [
+    path('', views.WebhookList.as_view(), name='webhooks-list'),
+    path('/<pk>', views.WebhookDetail.as_view(), name='webhook-detail'),
+]
@@ -0,0 +1,29 @@
+from rest_framework import generics
+from rest_framework.permissions import IsAuthenticated
+from oauth2_provider.contrib.rest_framework import TokenHasReadWriteScope
+from users.models import get_organization_id
+from .models import Webhook
+from .serializers import WebhookSerializer
+
+
+def organization_webhooks(user):
+    organization_id = get_organization_id(user)
+    if organization_id is None:
+        return Webhook.objects.filter(organization__isnull=True)
+    return Webhook.objects.filter(organization_id=organization_id)
+
+
+class WebhookList(generics.ListCreateAPIView):
+    permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
+    serializer_class = WebhookSerializer
+
+    def get_queryset(self):
+        return organization_webhooks(self.request.user).order_by('id')
+
+
+class WebhookDetail(generics.RetrieveUpdateDestroyAPIView):
+    permission_classes = [IsAuthenticated, TokenHasReadWriteScope]
+    serializer_class = WebhookSerializer
+
+    def get_queryset(self):
+        return organization_webhooks(self.request.user)